@@ -0,0 +1,266 @@
+# Content-addressed on-disk store of processed floorplans, so a repeat upload or a restart skips the pipeline
+import hashlib
+import json
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Tuple, Dict, Any, List, Optional, Callable
+
+import numpy as np
+
+# Root directory of the store, one sub-directory per key
+ARTIFACTS_PATH = os.environ.get("PATH_HERO_ARTIFACTS_PATH", os.path.join("cache", "floorplans"))
+# Most bytes of files the store may keep; beyond it the least recently used entries are deleted
+ARTIFACTS_MAX_BYTES = int(os.environ.get("PATH_HERO_ARTIFACTS_MAX_BYTES", 4 << 30))
+# Files no entry uses are only deleted once they are this old, as a save writes its files before its entry
+ARTIFACTS_GRACE_SECONDS = 3600
+# Bump whenever the floorplan pipeline changes its output, so stale artifacts are never served
+PIPELINE_VERSION = 5
+
+_KEY_PATTERN = re.compile(r"[0-9a-f]{64}")
+
+
+def artifact_key(image_bytes: bytes, **params: Any) -> str:
+    """
+    SHA-256 of the encoded image file and the processing parameters that shaped its artifacts.
+    """
+    return digest_artifact_key(hashlib.sha256(image_bytes), **params)
+
+
+def digest_artifact_key(image_digest: Any, **params: Any) -> str:
+    """
+    artifact_key of an image file whose bytes were fed into a hashlib.sha256() as they arrived.
+    """
+    digest = image_digest.copy()
+    digest.update(json.dumps({"version": PIPELINE_VERSION, **params}, sort_keys=True).encode())
+    return digest.hexdigest()
+
+
+@dataclass
+class FloorplanArtifacts:
+    image_digest: str  # SHA-256 of the encoded image file, see ArtifactStore.save_image_file
+    grid: np.ndarray
+    coordinates: Dict[str, Any]
+    # (distance, next_hop) fields of the route cache, keyed by label
+    route_fields: Dict[str, Tuple[np.ndarray, np.ndarray]] = field(default_factory=dict)
+
+
+class ArtifactStore:
+    """
+    Directory of processed floorplans keyed by artifact_key.
+
+    An entry is a meta.json with the coordinates and the names of the blobs it uses. Blobs are
+    the encoded image file, saved first by save_image_file, and the arrays (.npy, loaded
+    memory-mapped and read-only), each stored once under the SHA-256 of its content, so the
+    edits of a floorplan share its image and every field they carry over. Blobs and entries are
+    written to temporary paths and renamed into place, so readers only ever see complete ones.
+
+    Entries never change, so the store is bounded by deleting whole entries, least recently
+    saved or loaded first, and then the files that no entry uses any more; see prune.
+    """
+
+    def __init__(self, root: str = ARTIFACTS_PATH, max_bytes: int = ARTIFACTS_MAX_BYTES):
+        self.root = root
+        self.max_bytes = max_bytes
+        self._prune_lock = threading.Lock()
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.root, key)
+
+    def image_path(self, key: str) -> str:
+        return os.path.join(self.root, "images", f"{key}.npy")
+
+    def blob_path(self, name: str) -> str:
+        return os.path.join(self.root, "blobs", name)
+
+    def save_image(self, key: str, image: np.ndarray) -> np.ndarray:
+        """
+        Write a decoded image to the store and return a read-only memory map of it, so that a
+        huge image does not have to stay in memory while it is processed. Images are keyed by
+        the SHA-256 of their encoded file, so every floorplan and edit of one image shares it.
+        """
+        def write(file):
+            np.save(file, image)
+        self._write_once(self.image_path(key), write)
+        return self.load_image(key)
+
+    def load_image(self, key: str) -> Optional[np.ndarray]:
+        """
+        Read-only memory map of an image written by save_image, or None if there is none.
+        """
+        if not _KEY_PATTERN.fullmatch(key) or not os.path.exists(self.image_path(key)):
+            return None
+        return np.asarray(np.load(self.image_path(key), mmap_mode="r"))
+
+    def _write_once(self, path: str, write: Callable[[Any], None]):
+        try:
+            # Equal names mean equal content. A file that is reused is made young again, so a
+            # concurrent prune does not delete it before the entry that uses it is saved
+            os.utime(path)
+            return
+        except FileNotFoundError:
+            pass
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        descriptor, staging = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".staging-")
+        try:
+            with os.fdopen(descriptor, "wb") as file:
+                write(file)
+            os.replace(staging, path)
+        except OSError:
+            os.remove(staging)
+            raise
+
+    def _write_blob(self, name: str, write: Callable[[Any], None]) -> str:
+        self._write_once(self.blob_path(name), write)
+        return name
+
+    def save_image_file(self, image_bytes: bytes, digest: Optional[str] = None) -> str:
+        """
+        Write an encoded image file to the store, once, and return its SHA-256 (digest, if the
+        caller hashed it already), the name that entries and save_image refer to it by.
+        """
+        def write(file):
+            file.write(image_bytes)
+        return self._write_blob(digest or hashlib.sha256(image_bytes).hexdigest(), write)
+
+    def load_image_file(self, digest: str) -> Optional[bytes]:
+        """
+        Encoded image file written by save_image_file, or None if there is none.
+        """
+        if not _KEY_PATTERN.fullmatch(digest):
+            return None
+        try:
+            with open(self.blob_path(digest), "rb") as file:
+                return file.read()
+        except OSError:
+            return None
+
+    def _save_array(self, array: np.ndarray) -> str:
+        array = np.ascontiguousarray(array)
+        digest = hashlib.sha256(f"{array.dtype.str}{array.shape}".encode())
+        digest.update(memoryview(array).cast("B"))
+
+        def write(file):
+            np.save(file, array)
+        return self._write_blob(f"{digest.hexdigest()}.npy", write)
+
+    def _load_array(self, name: str) -> np.ndarray:
+        # A plain read-only ndarray view of the mapping, which pickles like any other array
+        return np.asarray(np.load(self.blob_path(name), mmap_mode="r"))
+
+    def load(self, key: str) -> Optional[FloorplanArtifacts]:
+        # Keys can come from requests, so never let one name another path
+        if not _KEY_PATTERN.fullmatch(key):
+            return None
+        path = self.path(key)
+        if not os.path.isdir(path):
+            return None
+        try:
+            with open(os.path.join(path, "meta.json")) as file:
+                meta = json.load(file)
+            # The age of meta.json tells prune when the entry was last used
+            os.utime(os.path.join(path, "meta.json"))
+            if not os.path.isfile(self.blob_path(meta["image"])):
+                raise FileNotFoundError(self.blob_path(meta["image"]))
+
+            return FloorplanArtifacts(
+                image_digest=meta["image"],
+                grid=self._load_array(meta["grid"]),
+                coordinates=meta["coordinates"],
+                route_fields={
+                    label: tuple(self._load_array(name) for name in names)
+                    for label, names in meta["route_fields"].items()
+                }
+            )
+        except (OSError, ValueError, KeyError, TypeError):
+            # A damaged entry is dropped, so the next save replaces it
+            shutil.rmtree(path, ignore_errors=True)
+            return None
+
+    def save(self, key: str, artifacts: FloorplanArtifacts):
+        target = self.path(key)
+        if os.path.isdir(target):
+            # Equal keys mean equal content
+            return
+        if not os.path.isfile(self.blob_path(artifacts.image_digest)):
+            # The image file was pruned since it was saved, so the entry could not be restored
+            # from the store; the floorplan stays in memory only
+            return
+        meta = {
+            "coordinates": artifacts.coordinates,
+            "image": artifacts.image_digest,
+            "grid": self._save_array(np.asarray(artifacts.grid)),
+            "route_fields": {
+                label: [self._save_array(array) for array in field]
+                for label, field in artifacts.route_fields.items()
+            }
+        }
+        os.makedirs(self.root, exist_ok=True)
+        staging = tempfile.mkdtemp(dir=self.root, prefix=".staging-")
+        try:
+            with open(os.path.join(staging, "meta.json"), "w") as file:
+                json.dump(meta, file)
+            os.replace(staging, target)
+        except OSError:
+            shutil.rmtree(staging, ignore_errors=True)
+            # Losing the race against a concurrent save of the same key is fine
+            if not os.path.isdir(target):
+                raise
+        self.prune()
+
+    def _files(self, meta: Dict[str, Any]) -> List[str]:
+        names = [meta["image"], meta["grid"], *(name for names in meta["route_fields"].values() for name in names)]
+        # The decoded image of save_image is keyed by the digest of the image file
+        return [self.blob_path(name) for name in names] + [self.image_path(meta["image"])]
+
+    def prune(self):
+        """
+        Delete the least recently saved or loaded entries until the files of the store take no
+        more than max_bytes, then every file that no entry uses. The newest entry always stays,
+        and files younger than ARTIFACTS_GRACE_SECONDS are kept for saves still in progress.
+        """
+        with self._prune_lock:
+            entries = []
+            for key in os.listdir(self.root) if os.path.isdir(self.root) else []:
+                if not _KEY_PATTERN.fullmatch(key):
+                    continue
+                meta_path = os.path.join(self.path(key), "meta.json")
+                try:
+                    last_used = os.path.getmtime(meta_path)
+                    with open(meta_path) as file:
+                        entries.append((last_used, key, set(self._files(json.load(file)))))
+                except (OSError, ValueError, KeyError, TypeError, AttributeError):
+                    # Damaged entries are dropped by load
+                    continue
+
+            files = {}
+            for directory in (os.path.dirname(self.blob_path("")), os.path.dirname(self.image_path(""))):
+                for entry in os.scandir(directory) if os.path.isdir(directory) else []:
+                    stat = entry.stat()
+                    files[entry.path] = (stat.st_size, stat.st_mtime)
+
+            references = Counter(path for _, _, paths in entries for path in paths)
+            deadline = time.time() - ARTIFACTS_GRACE_SECONDS
+            total = sum(size for size, _ in files.values())
+            entries.sort()
+            while len(entries) > 1 and total > self.max_bytes:
+                _, key, paths = entries.pop(0)
+                shutil.rmtree(self.path(key), ignore_errors=True)
+                references.subtract(paths)
+                freed = [path for path in paths if references[path] == 0 and path in files and files[path][1] < deadline]
+                total -= sum(files[path][0] for path in freed)
+
+            for path, (_, modified) in files.items():
+                if references[path] <= 0 and modified < deadline:
+                    try:
+                        os.remove(path)
+                    except FileNotFoundError:
+                        pass
+
+
+artifact_store = ArtifactStore()
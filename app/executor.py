@@ -0,0 +1,64 @@
+# Worker pools for CPU-bound work, so the async endpoints never block uvicorn's event loop
+import asyncio
+import multiprocessing
+import os
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+from typing import Any, Callable, Optional
+
+# Worker processes for pure-Python work such as A*; 0 runs that work on the thread pool instead
+PROCESS_WORKERS = int(os.environ.get("PATH_HERO_PROCESS_WORKERS", os.cpu_count() or 1))
+# Worker threads for calls that release the GIL: OpenCV, NumPy and pytesseract (which waits on a subprocess)
+THREAD_WORKERS = int(os.environ.get("PATH_HERO_THREAD_WORKERS", min(32, (os.cpu_count() or 1) + 4)))
+
+_process_pool: Optional[ProcessPoolExecutor] = None
+_thread_pool: Optional[ThreadPoolExecutor] = None
+
+
+def thread_pool() -> ThreadPoolExecutor:
+    global _thread_pool
+    if _thread_pool is None:
+        _thread_pool = ThreadPoolExecutor(max_workers=THREAD_WORKERS, thread_name_prefix="path-hero")
+    return _thread_pool
+
+
+def process_pool() -> Executor:
+    global _process_pool
+    if PROCESS_WORKERS <= 0:
+        return thread_pool()
+    if _process_pool is None:
+        # The server already runs threads (this module's pool, OpenCV's), and forking a threaded
+        # process can deadlock the child, so workers come from a clean fork server instead
+        if "forkserver" in multiprocessing.get_all_start_methods():
+            context = multiprocessing.get_context("forkserver")
+            # Forked from a server that has already imported the worker functions
+            context.set_forkserver_preload(["app.logic.pathfind"])
+        else:
+            context = multiprocessing.get_context("spawn")
+        _process_pool = ProcessPoolExecutor(max_workers=PROCESS_WORKERS, mp_context=context)
+    return _process_pool
+
+
+async def run_in_process(func: Callable, *args, **kwargs) -> Any:
+    """
+    Run func(*args, **kwargs) in the process pool. func and its arguments must be picklable,
+    and func cannot rely on server state such as app.registry, which is not shared with the worker processes.
+    """
+    return await asyncio.get_running_loop().run_in_executor(process_pool(), partial(func, *args, **kwargs))
+
+
+async def run_in_thread(func: Callable, *args, **kwargs) -> Any:
+    """
+    Run func(*args, **kwargs) in the thread pool.
+    """
+    return await asyncio.get_running_loop().run_in_executor(thread_pool(), partial(func, *args, **kwargs))
+
+
+def shutdown():
+    global _process_pool, _thread_pool
+    if _process_pool is not None:
+        _process_pool.shutdown(cancel_futures=True)
+        _process_pool = None
+    if _thread_pool is not None:
+        _thread_pool.shutdown(cancel_futures=True)
+        _thread_pool = None
@@ -1,11 +1,21 @@
+import asyncio
+import json
+from collections import deque
+from contextlib import aclosing
+from typing import Any, AsyncIterator
+
 import numpy as np
 from fastapi import APIRouter
+from fastapi.responses import JSONResponse, StreamingResponse
 from pydantic import BaseModel
 
-import app.globals as globals
-from app.logic.llm.recommendation import recommend, FireRecommendations
-from app.logic.pathfind import get_path, heuristic_fire, a_star_pathfinding, pixel_to_grid, grid_to_pixel
-from app.logic.pathfind import get_path, heuristic_fire, a_star_pathfinding, pixel_to_grid, grid_to_pixel
+from app.executor import run_in_process, run_in_thread
+from app.logic.llm.cache import recommendation_cache, recommendation_key
+from app.logic.llm.fallback import fallback_recommend
+from app.logic.llm.recommendation import recommend, recommend_steps, FireRecommendations, RecommendationUnavailable, Step
+from app.logic.pathfind import multi_target_pathfinding, grid_to_pixel, fire_zone_mask, fire_cost_field
+from app.logic.route_cache import label_cells, room_at
+from app.registry import Floorplan, get_floorplan
 
 fire_router = APIRouter()
 
@@ -13,6 +23,8 @@ fire_router = APIRouter()
 class Props(BaseModel):
     coordinates: list[tuple[float, float]]
     description: str
+    fire_size: str = "s"
+    floorplan_id: str | None = None
 
 
 def merge_lines_in_path(path: list[tuple[int, int]]) -> list[tuple[int, int]]:
@@ -33,121 +45,188 @@ def merge_lines_in_path(path: list[tuple[int, int]]) -> list[tuple[int, int]]:
     return result
 
 
-@fire_router.post("/api/fire")
-async def fire(props: Props):
+async def route_segment(
+    floorplan: Floorplan,
+    start_label: str,
+    end_label: str,
+    fire_costs: np.ndarray,
+    hazard: np.ndarray
+) -> list[tuple[int, int]]:
     """
-    :param coordinates: list of fire coordinates in (x,y) format, with origin in the top left corner
-    :param description: llm prompt to describe the fire
-    :return:
+    Cheapest grid route of floorplan, weighted by fire_costs, from any instance of start_label to any instance of
+    end_label. Returns [] if either label is unknown or there is no route. See fire_zone_of for the arguments.
     """
-    # globals.numpy_image, globals.coordinates, globals.grid
-    # Coordinates are expected in y,x order
-    fire_coordinate: tuple[int, int] = (int(props.coordinates[0][0]), int(props.coordinates[0][1]))
+    all_possible_start = label_cells(floorplan.coordinates, start_label, grid_size=10)
+    all_possible_end = label_cells(floorplan.coordinates, end_label, grid_size=10)
 
-    # Get fire recommendation. Internally, the recommendation might include a class_of_fire value (e.g., "A", "B", ...)
-    recommendation: FireRecommendations = await recommend(image=globals.numpy_image, fire_coordinate=fire_coordinate)
+    # If either start or end doesn't exist in our mapping, skip
+    if not all_possible_start or not all_possible_end:
+        return []
 
-    routes: list[list[tuple[int, int]]] = []
-    for instruction_path in recommendation.instruction_paths:
-        # If the instruction_path has 1 or 0 elements, no actual path needed
-        if len(instruction_path) < 2:
-            routes.append([])
+    # Cached routes that stay clear of the fire are still the shortest ones; search only when they are not
+    cached_route = await run_in_thread(floorplan.route_cache.best_route, start_label, end_label, hazard)
+    if cached_route is not None:
+        best_distance, best_route_grid = cached_route
+    else:
+        # One multi-source search over every start-end pair, off the event loop
+        best_distance, _, _, best_route_grid = await run_in_process(
+            multi_target_pathfinding,
+            floorplan.grid,
+            all_possible_start,
+            all_possible_end,
+            heuristic=True,
+            fire_costs=fire_costs
+        )
+
+    if best_distance == float("inf"):
+        # No path found among any start-end combos
+        return []
+    return best_route_grid
+
+
+def schedule_segments(
+    floorplan: Floorplan,
+    instruction_path: list[str],
+    segment_routes: dict[tuple[str, str], asyncio.Task],
+    fire_costs: np.ndarray,
+    hazard: np.ndarray
+):
+    """
+    Start routing every segment of instruction_path that is not in segment_routes yet, e.g.:
+    if instruction_path == ["exit", "Toilet", "exit"]
+    segment 1 = ("exit", "Toilet"), segment 2 = ("Toilet", "exit")
+    """
+    for segment in zip(instruction_path, instruction_path[1:]):
+        if segment not in segment_routes:
+            segment_routes[segment] = asyncio.ensure_future(
+                route_segment(floorplan, *segment, fire_costs, hazard)
+            )
+
+
+async def instruction_route(
+    instruction_path: list[str],
+    segment_routes: dict[tuple[str, str], asyncio.Task]
+) -> list[tuple[int, int]]:
+    """
+    Pixel route of instruction_path from the routes of its segments, started by schedule_segments.
+    """
+    # If the instruction_path has 1 or 0 elements, no actual path needed
+    if len(instruction_path) < 2:
+        return []
+
+    accumulated_pixel_path: list[tuple[int, int]] = []
+
+    # Build the route segment by segment
+    for i, segment in enumerate(zip(instruction_path, instruction_path[1:])):
+        best_route_grid = await segment_routes[segment]
+        if not best_route_grid:
             continue
 
-        accumulated_pixel_path: list[tuple[int, int]] = []
+        best_route_pixels = [grid_to_pixel(rc, 10) for rc in best_route_grid]
 
-        # Build the route segment by segment, e.g.:
-        # if instruction_path == ["exit", "Toilet", "exit"]
-        # segment 1 = ("exit", "Toilet"), segment 2 = ("Toilet", "exit")
-        number_of_routes = len(instruction_path) - 1
+        # Concatenate this segment route into accumulated path
+        if i == 0:
+            # First segment: add everything
+            accumulated_pixel_path.extend(best_route_pixels)
+        else:
+            # If continuing from the last segment, skip the first node
+            # to avoid duplication, because it should match the end of the previous segment
+            accumulated_pixel_path.extend(best_route_pixels[1:])
 
-        for i in range(number_of_routes):
-            start_label = instruction_path[i]
-            end_label   = instruction_path[i + 1]
+    # Optionally merge collinear segments to reduce unneeded waypoints
+    return merge_lines_in_path(accumulated_pixel_path)
 
-            all_possible_start = []
-            if start_label in globals.coordinates["icons"]:
-                all_possible_start = globals.coordinates["icons"][start_label]
-            elif start_label in globals.coordinates["rooms"]:
-                all_possible_start = globals.coordinates["rooms"][start_label]
 
-            all_possible_end = []
-            if end_label in globals.coordinates["icons"]:
-                all_possible_end = globals.coordinates["icons"][end_label]
-            elif end_label in globals.coordinates["rooms"]:
-                all_possible_end = globals.coordinates["rooms"][end_label]
+async def fire_zone_of(
+    floorplan: Floorplan,
+    fire_coordinates: list[tuple[int, int]],
+    fire_size: str
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    The fire_cost_field of the fires, built once per request for every segment search, and the hazard: the cells
+    that cost more than 1 to enter, i.e. the fire zones and the cells around them. Cached routes that touch none of
+    them are still the cheapest ones.
+    """
+    fire_zone = await run_in_thread(
+        fire_zone_mask, np.shape(floorplan.grid), fire_coordinates, fire_size=fire_size, grid_size=10
+    )
+    fire_costs = await run_in_thread(fire_cost_field, fire_zone)
+    return fire_costs, fire_costs > 1
 
-            # If either start or end doesn't exist in our mapping, skip
-            if not all_possible_start or not all_possible_end:
-                continue
 
-            # Prepare arrays to keep track of all route distances
-            current_possible_distances = np.full(
-                (len(all_possible_start), len(all_possible_end)), np.inf
-            )
-            current_possible_routes = np.empty(
-                (len(all_possible_start), len(all_possible_end)), dtype=object
+def fire_class_description(class_of_fire: str) -> str:
+    """
+    Description of the class of fire in a recommendation.
+    """
+    # You can adjust these messages as needed.
+    if class_of_fire == "A":
+        return "Class A fire: Involving ordinary combustibles such as wood, paper, and cloth. Use water or foam extinguishers."
+    elif class_of_fire == "B":
+        return "Class B fire: Involving flammable liquids such as gasoline, oil, or paint. Use foam, dry chemical, or carbon dioxide extinguishers."
+    elif class_of_fire == "C":
+        return "Class C fire: Involving energized electrical equipment. Use non-conductive extinguishing agents like carbon dioxide or dry chemical."
+    elif class_of_fire == "D":
+        return "Class D fire: Involving combustible metals like magnesium or titanium. Use specialized dry powder extinguishers."
+    elif class_of_fire == "E":
+        return "Class E fire: (This class is sometimes used to denote fires involving electrical equipment. Verify local classifications.)"
+    elif class_of_fire == "F":
+        return "Class F fire: Involving cooking oils and fats, common in kitchen fires. Use wet chemical extinguishers."
+    else:
+        return "Unknown fire class. Please consult a fire safety specialist."
+
+
+@fire_router.post("/api/fire")
+async def fire(props: Props):
+    """
+    :param coordinates: list of fire coordinates in (x,y) format, with origin in the top left corner
+    :param description: llm prompt to describe the fire
+    :param fire_size: "s" for small or "l" for large fires, sets the radius of the zone around every fire coordinate
+        that routes only cross to reach or leave a place inside it
+    :param floorplan_id: floorplan_id returned by /api/floorplan, defaults to the latest floorplan
+    :return:
+    """
+    floorplan = await get_floorplan(props.floorplan_id)
+    if floorplan is None:
+        return JSONResponse(
+            status_code=404,
+            content={"error": f"Unknown floorplan '{props.floorplan_id}'." if props.floorplan_id else "No floorplan loaded."}
+        )
+
+    # Coordinates are expected in y,x order
+    fire_coordinates: list[tuple[int, int]] = [(int(y), int(x)) for y, x in props.coordinates]
+    fire_coordinate: tuple[int, int] = fire_coordinates[0]
+
+    # Get fire recommendation. Internally, the recommendation might include a class_of_fire value (e.g., "A", "B", ...)
+    # Reports of a fire in the same room with the same description share one recommendation
+    fire_room = room_at(floorplan.coordinates, fire_coordinate)
+    try:
+        recommendation: FireRecommendations = await recommendation_cache.get_or_create(
+            recommendation_key(floorplan.floorplan_id, fire_room, props.description),
+            lambda: recommend(
+                image=floorplan.image,
+                fire_coordinate=fire_coordinate,
+                description=props.description,
+                coordinates=floorplan.coordinates,
+                floorplan_id=floorplan.floorplan_id
             )
+        )
+    except RecommendationUnavailable as error:
+        # No key, a failed call or a missed deadline: answer from the floorplan alone, without caching it
+        print(error)
+        recommendation = fallback_recommend(floorplan.coordinates, fire_coordinate, props.description)
 
-            # For each possible start-end pair, run A* to find a path
-            for j, possible_start in enumerate(all_possible_start):
-                for k, possible_end in enumerate(all_possible_end):
-                    start_grid = pixel_to_grid((possible_start[0], possible_start[1]), grid_size=10)
-                    end_grid   = pixel_to_grid((possible_end[0], possible_end[1]), grid_size=10)
-
-                    distance, route_grid = a_star_pathfinding(
-                        globals.grid,
-                        start_grid,
-                        [end_grid],
-                        heuristic=True,
-                        fire_coords=[fire_coordinate]
-                    )
-
-                    current_possible_distances[j, k] = distance
-                    current_possible_routes[j, k] = route_grid
-
-            # Select the minimum distance route among all possible combos
-            min_index = np.argmin(current_possible_distances)
-            row, col = np.unravel_index(min_index, current_possible_distances.shape)
-            best_distance = current_possible_distances[row, col]
-            best_route_grid = current_possible_routes[row, col]
-
-            if best_distance == float("inf") or not best_route_grid:
-                # No path found among any start-end combos
-                continue
-
-            best_route_pixels = [grid_to_pixel(rc, 10) for rc in best_route_grid]
-
-            # Concatenate this segment route into accumulated path
-            if i == 0:
-                # First segment: add everything
-                accumulated_pixel_path.extend(best_route_pixels)
-            else:
-                # If continuing from the last segment, skip the first node
-                # to avoid duplication, because it should match the end of the previous segment
-                accumulated_pixel_path.extend(best_route_pixels[1:])
-
-        # Optionally merge collinear segments to reduce unneeded waypoints
-        merged_path = merge_lines_in_path(accumulated_pixel_path)
-        routes.append(merged_path)
+    fire_costs, hazard = await fire_zone_of(floorplan, fire_coordinates, props.fire_size)
+
+    # Route every distinct segment once, all of them concurrently
+    segment_routes: dict[tuple[str, str], asyncio.Task] = {}
+    for instruction_path in recommendation.instruction_paths:
+        schedule_segments(floorplan, instruction_path, segment_routes, fire_costs, hazard)
+    routes: list[list[tuple[int, int]]] = await asyncio.gather(*(
+        instruction_route(instruction_path, segment_routes) for instruction_path in recommendation.instruction_paths
+    ))
 
     # Determine appropriate fire class description based on the fire recommendation
-    # You can adjust these messages as needed.
-    fire_class_desc = ""
-    if recommendation.class_of_fire == "A":
-        fire_class_desc = "Class A fire: Involving ordinary combustibles such as wood, paper, and cloth. Use water or foam extinguishers."
-    elif recommendation.class_of_fire == "B":
-        fire_class_desc = "Class B fire: Involving flammable liquids such as gasoline, oil, or paint. Use foam, dry chemical, or carbon dioxide extinguishers."
-    elif recommendation.class_of_fire == "C":
-        fire_class_desc = "Class C fire: Involving energized electrical equipment. Use non-conductive extinguishing agents like carbon dioxide or dry chemical."
-    elif recommendation.class_of_fire == "D":
-        fire_class_desc = "Class D fire: Involving combustible metals like magnesium or titanium. Use specialized dry powder extinguishers."
-    elif recommendation.class_of_fire == "E":
-        fire_class_desc = "Class E fire: (This class is sometimes used to denote fires involving electrical equipment. Verify local classifications.)"
-    elif recommendation.class_of_fire == "F":
-        fire_class_desc = "Class F fire: Involving cooking oils and fats, common in kitchen fires. Use wet chemical extinguishers."
-    else:
-        fire_class_desc = "Unknown fire class. Please consult a fire safety specialist."
+    fire_class_desc = fire_class_description(recommendation.class_of_fire)
 
     print({
         "instructions": recommendation.instructions,
@@ -166,3 +245,136 @@ async def fire(props: Props):
         "instruction_paths": recommendation.instruction_paths,
         "fire_class_desc": fire_class_desc
     }
+
+
+async def recommendation_events(floorplan: Floorplan, fire_coordinate: tuple[int, int], description: str) -> AsyncIterator[tuple[str, Any]]:
+    """
+    The recommendation for a fire as the events of recommend_steps, from the recommendation cache, the model or,
+    if the model fails before its first step, fallback_recommend. Ends with ("source", "cache" | "model" | "fallback"),
+    after ("error", message) if the model failed part way. Complete answers of the model are cached.
+    """
+    key = recommendation_key(floorplan.floorplan_id, room_at(floorplan.coordinates, fire_coordinate), description)
+    recommendation = await run_in_thread(recommendation_cache.get, key)
+    source = "cache"
+    if recommendation is None:
+        fields, steps = {}, []
+        try:
+            async with aclosing(recommend_steps(
+                image=floorplan.image,
+                fire_coordinate=fire_coordinate,
+                description=description,
+                coordinates=floorplan.coordinates,
+                floorplan_id=floorplan.floorplan_id
+            )) as events:
+                async for name, value in events:
+                    if name == "step":
+                        steps.append(value)
+                    else:
+                        fields[name] = value
+                    yield name, value
+            recommendation = FireRecommendations(
+                instructions=[step.text for step in steps],
+                instruction_paths=[[label for label in step.path if label] for step in steps],
+                **fields
+            )
+        except (RecommendationUnavailable, ValueError) as error:
+            print(error)
+            if steps:
+                yield "error", str(error)
+                yield "source", "model"
+                return
+            recommendation = fallback_recommend(floorplan.coordinates, fire_coordinate, description)
+            source = "fallback"
+        else:
+            await run_in_thread(recommendation_cache.put, key, recommendation)
+            yield "source", "model"
+            return
+
+    for name in ("fire_location", "class_of_fire", "object_on_fire"):
+        yield name, getattr(recommendation, name)
+    for text, path in zip(recommendation.instructions, recommendation.instruction_paths):
+        yield "step", Step(text=text, path=path)
+    yield "source", source
+
+
+def server_sent_event(event: str, data: Any) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+@fire_router.post("/api/fire/stream")
+async def fire_stream(props: Props):
+    """
+    Same data as /api/fire as server-sent events, each sent as soon as it is known:
+    - "detail": {"fire_location": ...}, {"object_on_fire": ...} or {"class_of_fire": ..., "fire_class_desc": ...}
+    - "instruction": {"index", "instruction", "instruction_path", "route"} per instruction, in order; every
+      instruction is routed as soon as the model has generated its path, while it generates the next ones
+    - "error": {"error"} if the model fails after some instructions
+    - "done": {"source": "cache" | "model" | "fallback"} last
+    """
+    floorplan = await get_floorplan(props.floorplan_id)
+    if floorplan is None:
+        return JSONResponse(
+            status_code=404,
+            content={"error": f"Unknown floorplan '{props.floorplan_id}'." if props.floorplan_id else "No floorplan loaded."}
+        )
+
+    # Coordinates are expected in y,x order
+    fire_coordinates: list[tuple[int, int]] = [(int(y), int(x)) for y, x in props.coordinates]
+    fire_zone = asyncio.ensure_future(fire_zone_of(floorplan, fire_coordinates, props.fire_size))
+    segment_routes: dict[tuple[str, str], asyncio.Task] = {}
+
+    async def route(instruction_path: list[str]) -> list[tuple[int, int]]:
+        schedule_segments(floorplan, instruction_path, segment_routes, *await fire_zone)
+        return await instruction_route(instruction_path, segment_routes)
+
+    async def events():
+        stream = recommendation_events(floorplan, fire_coordinates[0], props.description)
+        next_event = asyncio.ensure_future(anext(stream))
+        # Instructions whose routes are being computed: (index, instruction, instruction_path, route task)
+        pending: deque = deque()
+        instructions = 0
+        source = None
+        try:
+            while next_event is not None or pending:
+                waiting = [task for task in (next_event, pending[0][3] if pending else None) if task is not None]
+                await asyncio.wait(waiting, return_when=asyncio.FIRST_COMPLETED)
+                while pending and pending[0][3].done():
+                    index, instruction, instruction_path, task = pending.popleft()
+                    yield server_sent_event("instruction", {
+                        "index": index,
+                        "instruction": instruction,
+                        "instruction_path": instruction_path,
+                        "route": task.result()
+                    })
+                if next_event is None or not next_event.done():
+                    continue
+                try:
+                    name, value = next_event.result()
+                except StopAsyncIteration:
+                    next_event = None
+                    continue
+                next_event = asyncio.ensure_future(anext(stream))
+                if name == "step":
+                    instruction_path = [label for label in value.path if label]
+                    pending.append((instructions, value.text, instruction_path, asyncio.ensure_future(route(instruction_path))))
+                    instructions += 1
+                elif name == "source":
+                    source = value
+                elif name == "error":
+                    yield server_sent_event("error", {"error": value})
+                elif name == "class_of_fire":
+                    yield server_sent_event("detail", {name: value, "fire_class_desc": fire_class_description(value)})
+                else:
+                    yield server_sent_event("detail", {name: value})
+            yield server_sent_event("done", {"source": source})
+        finally:
+            # The client went away: stop the model stream and drop routes nobody will read
+            for task in [next_event, fire_zone, *(entry[3] for entry in pending), *segment_routes.values()]:
+                if task is not None:
+                    task.cancel()
+            if next_event is not None:
+                await asyncio.gather(next_event, return_exceptions=True)
+            await stream.aclose()
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
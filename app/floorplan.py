@@ -1,186 +1,72 @@
-from fastapi import APIRouter, UploadFile, Form
-from fastapi.responses import JSONResponse
-from typing import List, Dict
+from fastapi import APIRouter, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+from starlette.formparsers import MultiPartException, MultiPartParser
+from typing import Tuple, List, Dict, Any, AsyncIterator, Iterator, Literal
 import numpy as np
-from PIL import Image
 import cv2
-import pytesseract
 from pydantic import BaseModel
 
-from .logic.pathfind import get_path, initialize_grid
-import app.globals as globals
+from .logic.pathfind import build_grid, get_path_to_exit, patch_grid
+from .logic.icons import ICON_SCALES, MATCH_THRESHOLD, load_icon_templates, match_icons, suppress_detections
+from .logic.ocr import TEXT_THRESHOLD, extract_text_with_boxes
+from .logic.route_cache import RouteCache
+from app.artifacts import artifact_key, artifact_store, digest_artifact_key
+from app.executor import run_in_thread
+from app.registry import Floorplan, get_floorplan, registry, save_floorplan
+import asyncio
+import hashlib
+import json
 import os
 
 floorplan_router = APIRouter()
 
-# Ensure globals has an 'numpy_image' attribute to store the numpy array
-if not hasattr(globals, 'numpy_image'):
-    globals.numpy_image = None
-
-if not hasattr(globals, 'coordinates'):
-    globals.coordinates = {}
-
-def merge_close_coordinates(detections, threshold=5):
-    merged_detections = []
-    for icon in detections:
-        coord = np.array(icon['coordinates'])
-        merged = False
-        for existing in merged_detections:
-            existing_coord = np.array(existing['coordinates'])
-            if np.all(np.abs(coord - existing_coord) <= threshold):
-                if icon['confidence'] > existing['confidence']:
-                    existing.update(icon)
-                merged = True
-                break
-        if not merged:
-            merged_detections.append(icon)
-    return merged_detections
-
-def extract_text_with_boxes(image_array: np.ndarray):
-    """Extract text and bounding boxes from the image using pytesseract."""
-    image = Image.fromarray(image_array)
-
-    # Convert to grayscale and filter non-black pixels
-    image_gray = image.convert("L")
-    image_array = np.array(image_gray)
-    threshold = 50
-    filtered_image_array = np.where(image_array < threshold, image_array, 255)
-    filtered_image = Image.fromarray(filtered_image_array.astype(np.uint8))
-
-    # Perform OCR
-    data = pytesseract.image_to_data(filtered_image, output_type=pytesseract.Output.DICT)
-
-    bounding_boxes = []
-    for i in range(len(data['text'])):
-        text = data['text'][i]
-        try:
-            conf = float(data['conf'][i])
-            if text.strip() and conf > 50:  # Filter low-confidence text
-                x, y, w, h = (data['left'][i], data['top'][i],
-                              data['width'][i], data['height'][i])
-                # Save coordinates as (x, y, x+w, y+h)
-                bounding_boxes.append({
-                    'text': text,
-                    'coordinates': (int(x), int(y), int(x + w), int(y + h))
-                })
-        except ValueError:
-            continue
-
-    # Combine nearby bounding boxes
-    return combine_bounding_boxes(bounding_boxes)
-
-def combine_bounding_boxes(bounding_boxes, distance_threshold=50):
-    """Combine bounding boxes that are close to each other."""
-    combined_boxes = []
-    used = set()
-
-    for i, box1 in enumerate(bounding_boxes):
-        if i in used:
-            continue
-        combined_text = box1['text']
-        combined_coords = list(box1['coordinates'])
-        used.add(i)
-
-        for j, box2 in enumerate(bounding_boxes):
-            if j in used or i == j:
-                continue
-            if calculate_distance(combined_coords, box2['coordinates']) < distance_threshold:
-                combined_text += f" {box2['text']}"
-                x1, y1, x2, y2 = combined_coords
-                x3, y3, x4, y4 = box2['coordinates']
-                combined_coords = [
-                    min(x1, x3), 
-                    min(y1, y3), 
-                    max(x2, x4), 
-                    max(y2, y4)
-                ]
-                used.add(j)
-
-        # Ensure coordinates are native ints
-        combined_boxes.append({
-            'text': combined_text,
-            'coordinates': (int(combined_coords[0]), int(combined_coords[1]), 
-                            int(combined_coords[2]), int(combined_coords[3]))
-        })
-
-    return combined_boxes
-
-def calculate_distance(box1, box2):
-    """Calculate distance between two bounding boxes."""
-    x1, y1, x2, y2 = box1
-    x3, y3, x4, y4 = box2
-    return max(0, max(x3 - x2, x1 - x4)) + max(0, max(y3 - y2, y1 - y4))
+# Largest image accepted by /api/floorplan/upload
+MAX_UPLOAD_BYTES = int(os.environ.get("PATH_HERO_MAX_UPLOAD_BYTES", 64 << 20))
+# Upload bodies are read and hashed in chunks of this many bytes
+UPLOAD_CHUNK_SIZE = 1 << 20
+# Decoded images with more pixels than this are moved to a memory map instead of staying in memory
+MAPPED_IMAGE_PIXELS = int(os.environ.get("PATH_HERO_MAPPED_IMAGE_PIXELS", 25_000_000))
 
 class Props(BaseModel):
     description: str
     image_filename: str
 
-@floorplan_router.post("/api/floorplan")
-async def floorplan(props: Props) -> JSONResponse:
-    description = props.description
-    image_filename = props.image_filename
-
-    # Validate the file type
-    if not image_filename.endswith(".png"):
-        return JSONResponse(
-            status_code=400,
-            content={"error": "Invalid file type. Only .png files are supported."}
-        )
-
-    # Load the image from disk
-    image_path = os.path.join("static", "images", "floor", image_filename)
-    image = cv2.imread(image_path)
-
-    if image is None:
-        return JSONResponse(
-            status_code=400,
-            content={"error": f"Failed to open the image at '{image_path}'."}
-        )
-
-    # Save image to globals and initialize grid
-    globals.numpy_image = image
-    initialize_grid(image)
-
+class Patch(BaseModel):
+    # "wall" blocks every grid cell the box touches, "open" clears them, "image" rebuilds them from the image
+    kind: Literal["wall", "open", "image"]
+    box: tuple[int, int, int, int]  # (y1, x1, y2, x2) in pixels, y2 and x2 exclusive
+
+class EditProps(BaseModel):
+    floorplan_id: str | None = None  # Defaults to the latest floorplan
+    patches: list[Patch] = []
+    icons: dict[str, list[tuple[int, int, int, int]]] = {}  # Icons to add, as (y1, x1, y2, x2) boxes
+
+async def process_floorplan(
+    floorplan_id: str,
+    image: np.ndarray,
+    image_digest: str,
+    progress: asyncio.Queue | None = None
+) -> Floorplan:
+    """
+    Run the full pipeline on a decoded floorplan image: walls, icons, room labels and exit routes.
+
+    image_digest is the SHA-256 of the encoded image file, which must be in the artifact store already.
+    If progress is given, ("icons", floorplan_id, coordinates without "rooms") is put on it as soon as
+    the icons are detected, and ("floorplan", Floorplan) as soon as it is complete, before it is saved.
+    """
     # Extract dimensions (height and width) as native ints
     height, width = int(image.shape[0]), int(image.shape[1])
 
-    # Convert to grayscale for icon detection
-    gray_image = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-
-    # Icon detection logic
-    base_path = "static/images/icons"
-    icon_paths = [
-        os.path.join(base_path, f)
-        for f in os.listdir(base_path)
-        if f.endswith(('.png', '.jpg', '.jpeg'))
-    ]
-
-    detected_icons = []
-    for icon_path in icon_paths:
-        icon = cv2.imread(icon_path)
-        if icon is None:
-            continue
-        gray_icon = cv2.cvtColor(icon, cv2.COLOR_BGR2GRAY)
-        result = cv2.matchTemplate(gray_image, gray_icon, cv2.TM_CCOEFF_NORMED)
-        threshold = 0.8
-        locations = np.where(result >= threshold)
-
-        for pt in zip(*locations[::-1]):  # Switch x and y
-            confidence = float(result[pt[1], pt[0]])
-            # Original box: (x1, y1, x2, y2)
-            x1, y1 = pt[0], pt[1]
-            x2, y2 = x1 + int(gray_icon.shape[1]), y1 + int(gray_icon.shape[0])
-
-            detected_icons.append({
-                "icon_path": os.path.basename(icon_path),
-                "coordinates": [int(x1), int(y1), int(x2), int(y2)],  # (x1, y1, x2, y2)
-                "confidence": confidence
-            })
-
-    filtered_icons = merge_close_coordinates(detected_icons)
-
-    # Text extraction
-    combined_bounding_boxes = extract_text_with_boxes(globals.numpy_image)
+    # Walls, icon detection and text extraction, side by side on the thread pool (OpenCV and tesseract release the GIL)
+    grid_task = asyncio.ensure_future(run_in_thread(build_grid, image))
+    text_task = asyncio.ensure_future(extract_text_with_boxes(image))
+    try:
+        detected_icons = await match_icons(image)
+    except BaseException:
+        grid_task.cancel()
+        text_task.cancel()
+        raise
+    filtered_icons = await run_in_thread(suppress_detections, detected_icons)
 
     # Build icons dictionary in (y1, x1, y2, x2) format
     icons_dict = {}
@@ -191,6 +77,17 @@ async def floorplan(props: Props) -> JSONResponse:
         x1, y1, x2, y2 = icon['coordinates']
         # Flip to (y1, x1, y2, x2)
         icons_dict[icon_name].append([int(y1), int(x1), int(y2), int(x2)])
+    if progress is not None:
+        progress.put_nowait(("icons", floorplan_id, {"icons": icons_dict, "grid_size": 10, "height": height, "width": width}))
+
+    try:
+        grid = await grid_task
+        # The icon fields, the exit field among them, are built while the room labels are still being read
+        icon_routes = await run_in_thread(RouteCache, grid, {"icons": icons_dict, "rooms": {}}, grid_size=10)
+        combined_bounding_boxes = await text_task
+    except BaseException:
+        text_task.cancel()
+        raise
 
     # Build rooms dictionary in (y1, x1, y2, x2) format
     rooms_dict = {}
@@ -202,32 +99,227 @@ async def floorplan(props: Props) -> JSONResponse:
         # Flip to (y1, x1, y2, x2)
         rooms_dict[text_name].append([int(y1), int(x1), int(y2), int(x2)])
 
-    # Store in globals (all native types)
-    response = {
+    # Coordinates of the floorplan (all native types)
+    coordinates = {
         "icons": icons_dict,  # Bounding boxes in (y1, x1, y2, x2)
         "rooms": rooms_dict,  # Bounding boxes in (y1, x1, y2, x2)
         "grid_size": 10,
         "height": height,
         "width": width
     }
-    globals.coordinates = response
-    print("coordinates", globals.coordinates)
+    print("coordinates", coordinates)
+
+    processed = Floorplan(
+        floorplan_id=floorplan_id,
+        image=image,
+        image_digest=image_digest,
+        grid=grid,
+        coordinates=coordinates,
+        route_cache=RouteCache(grid, coordinates, grid_size=10, fields=icon_routes.fields)
+    )
+    if progress is not None:
+        progress.put_nowait(("floorplan", processed))
+    await run_in_thread(save_floorplan, processed)
+    return processed
+
+async def edit_floorplan(floorplan: Floorplan, patches: List[Patch], icons: Dict[str, List[Tuple[int, int, int, int]]]) -> Floorplan:
+    """
+    Copy of a floorplan with wall patches and added icons.
+
+    Only the patched cells are recomputed. Distance fields that the edit leaves valid are carried
+    over, and the others are rebuilt, the icon fields (the exit field among them) right away and
+    the room fields on first use.
+    """
+    edits = [(patch.kind, tuple(patch.box)) for patch in patches]
+    # Edits of the same floorplan with the same patches get the same ID
+    edit_id = artifact_key(
+        floorplan.floorplan_id.encode(),
+        patches=[[kind, list(box)] for kind, box in edits],
+        icons=icons
+    )
+    existing = await get_floorplan(edit_id)
+    if existing is not None:
+        return existing
+
+    grid, closed, opened = await run_in_thread(patch_grid, floorplan.grid, floorplan.image, edits, 10)
+    icons_dict = dict(floorplan.coordinates["icons"])
+    for icon_name, boxes in icons.items():
+        icons_dict[icon_name] = icons_dict.get(icon_name, []) + [[int(coord) for coord in bbox] for bbox in boxes]
+    coordinates = {**floorplan.coordinates, "icons": icons_dict}
+
+    route_cache = await run_in_thread(
+        floorplan.route_cache.edited, grid, coordinates, closed, opened, tuple(icons)
+    )
+    edited = Floorplan(
+        floorplan_id=edit_id,
+        image=floorplan.image,
+        image_digest=floorplan.image_digest,
+        grid=grid,
+        coordinates=coordinates,
+        route_cache=route_cache
+    )
+    await run_in_thread(save_floorplan, edited)
+    return edited
+
+async def load_floorplan(
+    image_bytes: bytes | bytearray,
+    image_digest: Any,
+    source: str,
+    progress: asyncio.Queue | None = None
+) -> Floorplan | JSONResponse:
+    """
+    Floorplan of an encoded image, processed on first use, or an error response.
+
+    image_digest is hashlib.sha256() fed with image_bytes, and source describes the image in errors.
+    progress is passed on to process_floorplan.
+    """
+    # The same image with the same settings always gets the same ID
+    floorplan_id = digest_artifact_key(
+        image_digest,
+        grid_size=10,
+        icons=[file_name for file_name, _ in load_icon_templates()],
+        icon_scales=ICON_SCALES,
+        match_threshold=MATCH_THRESHOLD,
+        text_threshold=TEXT_THRESHOLD
+    )
+    # Serve a floorplan that is loaded already, or was processed before by this or an earlier server
+    loaded = await get_floorplan(floorplan_id) if image_bytes else None
+    if loaded is None:
+        # Decoded straight from the buffer, without copying it
+        image = await run_in_thread(cv2.imdecode, np.frombuffer(image_bytes, dtype=np.uint8), cv2.IMREAD_COLOR) if image_bytes else None
+
+        if image is None:
+            return JSONResponse(
+                status_code=400,
+                content={"error": f"Failed to open {source}."}
+            )
+        if min(image.shape[:2]) < 10:
+            # Not a single grid cell to route through
+            return JSONResponse(
+                status_code=400,
+                content={"error": f"{source[0].upper()}{source[1:]} is smaller than one 10 x 10 pixel grid cell."}
+            )
+        # Only the store keeps the encoded file; floorplans refer to it by its digest
+        await run_in_thread(artifact_store.save_image_file, image_bytes, image_digest.hexdigest())
+        if image.shape[0] * image.shape[1] > MAPPED_IMAGE_PIXELS:
+            # Every step below reads the image in bands or tiles, so a memory map of it is enough
+            image = await run_in_thread(artifact_store.save_image, image_digest.hexdigest(), image)
+        loaded = await process_floorplan(floorplan_id, image, image_digest.hexdigest(), progress)
+
+    registry.put(loaded)
+    return loaded
+
+async def open_floorplan(image_filename: str, progress: asyncio.Queue | None = None) -> Floorplan | JSONResponse:
+    """
+    Floorplan of a file in static/images/floor, processed on first use, or an error response.
+    progress is passed on to process_floorplan.
+    """
+    # Validate the file type
+    if not image_filename.endswith(".png"):
+        return JSONResponse(
+            status_code=400,
+            content={"error": "Invalid file type. Only .png files are supported."}
+        )
 
-    # Pathfinding initialization
-    img = globals.numpy_image
-    # Tell Vincent if this changes PLEASE, need change /api/fire
-    grid_size = 10
+    # Load the image from disk
+    image_path = os.path.join("static", "images", "floor", image_filename)
+    try:
+        with open(image_path, "rb") as file:
+            image_bytes = file.read()
+    except OSError:
+        image_bytes = b""
+    return await load_floorplan(image_bytes, hashlib.sha256(image_bytes), f"the image at '{image_path}'", progress)
+
+class UploadTooLarge(MultiPartException):
+    pass
+
+async def limited_body(request: Request, limit: int) -> AsyncIterator[bytes]:
+    """
+    The request body, chunk by chunk, raising UploadTooLarge once more than limit bytes arrived,
+    whatever the content-length header says (a chunked request has none).
+    """
+    received = 0
+    async for chunk in request.stream():
+        received += len(chunk)
+        if received > limit:
+            raise UploadTooLarge(f"Request body larger than {limit} bytes.")
+        yield chunk
+
+async def receive_upload(request: Request) -> Tuple[bytearray, Any] | JSONResponse:
+    """
+    Read an uploaded image into one buffer, hashing it chunk by chunk as it arrives.
+
+    The body is either multipart/form-data with the image in a "file" field, or the raw image bytes.
+    """
+    image_bytes = bytearray()
+    image_digest = hashlib.sha256()
+
+    def add(chunk: bytes) -> bool:
+        image_bytes.extend(chunk)
+        image_digest.update(chunk)
+        return len(image_bytes) <= MAX_UPLOAD_BYTES
+
+    too_large = JSONResponse(
+        status_code=413,
+        content={"error": f"Images larger than {MAX_UPLOAD_BYTES} bytes are not supported."}
+    )
+    try:
+        content_length = int(request.headers.get("content-length") or 0)
+    except ValueError:
+        return JSONResponse(
+            status_code=400,
+            content={"error": "Invalid content-length header."}
+        )
+    # A chunk of slack for the multipart boundaries and headers around the image
+    if content_length > MAX_UPLOAD_BYTES + UPLOAD_CHUNK_SIZE:
+        return too_large
+
+    if request.headers.get("content-type", "").startswith("multipart/form-data"):
+        try:
+            # The parser spools file parts to temporary files and closes them if it fails
+            form = await MultiPartParser(request.headers, limited_body(request, MAX_UPLOAD_BYTES + UPLOAD_CHUNK_SIZE)).parse()
+        except UploadTooLarge:
+            return too_large
+        except (MultiPartException, ValueError) as error:
+            # A malformed body; python-multipart raises ValueErrors
+            return JSONResponse(
+                status_code=400,
+                content={"error": str(error)}
+            )
+        try:
+            upload = form.get("file")
+            if not hasattr(upload, "read"):
+                return JSONResponse(
+                    status_code=400,
+                    content={"error": "Missing image in the 'file' form field."}
+                )
+            while chunk := await upload.read(UPLOAD_CHUNK_SIZE):
+                if not add(chunk):
+                    return too_large
+        finally:
+            await form.close()
+    else:
+        async for chunk in request.stream():
+            if not add(chunk):
+                return too_large
+    return image_bytes, image_digest
+
+def icons_summary(floorplan_id: str, coordinates: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    The fields of the /api/floorplan response that are known once the icons are detected.
+    """
     final = {}
+    final['floorplan_id'] = floorplan_id
 
     # Include the icons bounding boxes as is
-    final['icons'] = globals.coordinates["icons"]
-    final['height'] = globals.coordinates["height"]
-    final['width'] = globals.coordinates["width"]
+    final['icons'] = coordinates["icons"]
+    final['height'] = coordinates["height"]
+    final['width'] = coordinates["width"]
 
     # Compute midpoints for icons and rooms
     # For icons, compute midpoints for each icon box
     icons_midpoints = {}
-    for icon_name, boxes in globals.coordinates["icons"].items():
+    for icon_name, boxes in coordinates["icons"].items():
         midpoints = []
         for bbox in boxes:
             # bbox is in (y1, x1, y2, x2)
@@ -235,57 +327,156 @@ async def floorplan(props: Props) -> JSONResponse:
             x_mid = int((bbox[1] + bbox[3]) // 2)
             midpoints.append([y_mid, x_mid])
         icons_midpoints[icon_name] = midpoints
+    final['icons_midpoints'] = icons_midpoints
+    return final
 
+def rooms_midpoints(coordinates: Dict[str, Any]) -> Dict[str, List[List[int]]]:
+    """
+    The "rooms_midpoints" field of the /api/floorplan response.
+    """
     # For rooms, compute midpoints for each room box
     rooms_midpoints = {}
-    for room_name, boxes in globals.coordinates["rooms"].items():
+    for room_name, boxes in coordinates["rooms"].items():
         midpoints = []
         for bbox in boxes:
             y_mid = int((bbox[0] + bbox[2]) // 2)
             x_mid = int((bbox[1] + bbox[3]) // 2)
             midpoints.append([y_mid, x_mid])
         rooms_midpoints[room_name] = midpoints
-
-    # Include these new attributes in the final response
-    final['icons_midpoints'] = icons_midpoints
-    final['rooms_midpoints'] = rooms_midpoints
-
-    # Build rooms pathfinding results (using computed midpoints)
-    final['rooms'] = []
-    # For the exit icons, compute a combined list of midpoints to serve as destinations.
-    if "exit" in icons_dict:
-        exit_midpoints = [
-            [
-                int((bbox[0] + bbox[2]) // 2),  # y midpoint
-                int((bbox[1] + bbox[3]) // 2)   # x midpoint
-            ]
-            for bbox in icons_dict['exit']
-        ]
-    else:
-        exit_midpoints = []
-
-    for room_name, boxes in globals.coordinates["rooms"].items():
+    return rooms_midpoints
+
+def floorplan_summary(floorplan: Floorplan) -> Dict[str, Any]:
+    """
+    Every field of the /api/floorplan response except the room routes.
+    """
+    final = icons_summary(floorplan.floorplan_id, floorplan.coordinates)
+    final['rooms_midpoints'] = rooms_midpoints(floorplan.coordinates)
+    return final
+
+def room_routes(floorplan: Floorplan) -> Iterator[Dict[str, Any]]:
+    """
+    Route to the nearest exit of every room label, one entry of the "rooms" response field at a time.
+    """
+    # Tell Vincent if this changes PLEASE, need change /api/fire
+    grid_size = 10
+    for room_name, boxes in floorplan.coordinates["rooms"].items():
         for bbox in boxes:
             # bbox is in (y1, x1, y2, x2)
             y_mid = int((bbox[0] + bbox[2]) // 2)
             x_mid = int((bbox[1] + bbox[3]) // 2)
-            # Call get_path with (y, x)
-            cost, route = get_path(img, (y_mid, x_mid), exit_midpoints, grid_size, False)
+            # Walk the exit distance field from (y, x)
+            cost, route = get_path_to_exit(floorplan.grid, floorplan.exit_field, (y_mid, x_mid), grid_size)
             print('cost:', cost)
             # Convert route coordinates into native ints
             route_converted = [[int(point[0]), int(point[1])] for point in route]
-            final['rooms'].append({
+            yield {
                 "name": str(room_name),
                 "text_bounding_box_coords": [int(coord) for coord in bbox],
                 "route": route_converted
-            })
+            }
+
+@floorplan_router.post("/api/floorplan")
+async def floorplan(props: Props) -> JSONResponse:
+    loaded = await open_floorplan(props.image_filename)
+    if isinstance(loaded, JSONResponse):
+        return loaded
+
+    final = floorplan_summary(loaded)
+    # Build rooms pathfinding results (using computed midpoints)
+    final['rooms'] = list(room_routes(loaded))
+    return JSONResponse(content=final)
 
+@floorplan_router.post("/api/floorplan/upload")
+async def floorplan_upload(request: Request) -> JSONResponse:
+    """
+    Same as /api/floorplan for an image in the request body instead of a file on the server,
+    sent as multipart/form-data with a "file" field or as the raw image bytes.
+    """
+    upload = await receive_upload(request)
+    if isinstance(upload, JSONResponse):
+        return upload
+    image_bytes, image_digest = upload
+
+    loaded = await load_floorplan(image_bytes, image_digest, "the uploaded image")
+    if isinstance(loaded, JSONResponse):
+        return loaded
+
+    final = floorplan_summary(loaded)
+    final['rooms'] = list(room_routes(loaded))
     return JSONResponse(content=final)
 
+@floorplan_router.post("/api/floorplan/edit")
+async def floorplan_edit(props: EditProps) -> JSONResponse:
+    """
+    Apply wall patches and add icons to a loaded floorplan. Returns the /api/floorplan response of
+    the edited copy, whose floorplan_id is the one to use from then on.
+    """
+    loaded = await get_floorplan(props.floorplan_id)
+    if loaded is None:
+        return JSONResponse(
+            status_code=404,
+            content={"error": f"Unknown floorplan '{props.floorplan_id}'." if props.floorplan_id else "No floorplan loaded."}
+        )
+
+    edited = await edit_floorplan(loaded, props.patches, props.icons)
+    registry.put(edited)
+
+    final = floorplan_summary(edited)
+    final['rooms'] = list(room_routes(edited))
+    return JSONResponse(content=final)
+
+@floorplan_router.post("/api/floorplan/stream")
+async def floorplan_stream(props: Props):
+    """
+    Same data as /api/floorplan as newline-delimited JSON, each line sent as soon as it is known:
+    - {"floorplan_id", "icons", "height", "width", "icons_midpoints"} once the icons are detected;
+    - one line per element of "rooms" once the room labels are read, as soon as its route is walked;
+    - {"rooms_midpoints"} last.
+    A floorplan that was processed before is sent all at once.
+    """
+    progress: asyncio.Queue = asyncio.Queue()
+    # Never cancelled, so a floorplan is still saved and registered if the client goes away
+    loading = asyncio.ensure_future(open_floorplan(props.image_filename, progress))
+
+    async def next_event() -> Tuple[Any, ...]:
+        if progress.empty():
+            getter = asyncio.ensure_future(progress.get())
+            await asyncio.wait([getter, loading], return_when=asyncio.FIRST_COMPLETED)
+            if getter.done():
+                return getter.result()
+            getter.cancel()
+            # Processed before, failed validation, or raised
+            loaded = loading.result()
+            return ("error", loaded) if isinstance(loaded, JSONResponse) else ("floorplan", loaded)
+        return progress.get_nowait()
+
+    event = await next_event()
+    if event[0] == "error":
+        return event[1]
+
+    async def records(event: Tuple[Any, ...]):
+        if event[0] == "icons":
+            _, floorplan_id, coordinates = event
+            yield json.dumps(icons_summary(floorplan_id, coordinates)) + "\n"
+            event = await next_event()
+        else:
+            yield json.dumps(icons_summary(event[1].floorplan_id, event[1].coordinates)) + "\n"
+        loaded = event[1]
+        rooms = room_routes(loaded)
+        # Walked on the thread pool, off the event loop
+        while (room := await run_in_thread(next, rooms, None)) is not None:
+            yield json.dumps(room) + "\n"
+        yield json.dumps({"rooms_midpoints": rooms_midpoints(loaded.coordinates)}) + "\n"
+        # Saved and registered before the stream ends, so the floorplan_id can be used right away
+        await asyncio.shield(loading)
+
+    return StreamingResponse(records(event), media_type="application/x-ndjson")
+
 '''
 final = {
+    "floorplan_id": str,  # ID of the floorplan for /api/fire
     "icons": {
-        # Same structure as globals.coordinates["icons"], 
+        # Same structure as Floorplan.coordinates["icons"], 
         # keys are icon names and values are lists of bounding boxes.
         # Each bounding box is a list [y1, x1, y2, x2]
         "exit": List[List[int]],
@@ -4,6 +4,10 @@ import numpy as np
 # WALL_COLOR (BGR): 167, 73, 29
 WALL_COLOR = np.array([167, 73, 29])
 
+# 255 = wall, 0 = empty space, in one pass over the image
+def wall_mask(image):
+    return cv2.inRange(image, WALL_COLOR - 50, WALL_COLOR + 50)
+
 # True = wall, False = empty space
 def filter_walls(image):
     image = filter_walls_as_image(image)
@@ -12,8 +16,7 @@ def filter_walls(image):
 
 # 255 = empty space, 0 = wall
 def filter_walls_as_image(image):
-    image = -(cv2.inRange(image, WALL_COLOR - 50, WALL_COLOR + 50).astype(dtype="uint8") - 255)
-    return image
+    return cv2.bitwise_not(wall_mask(image))
 
 if __name__ == '__main__':
     img = cv2.imread(r'C:\Users\rithi\Documents\GitHub\path-hero\static\images\floor\hospital_simple.png')
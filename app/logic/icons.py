@@ -0,0 +1,135 @@
+# Icon template bank and parallel template matching for floorplan icon detection
+import asyncio
+import os
+from functools import lru_cache
+from typing import Tuple, List, Dict, Any
+
+import cv2
+import numpy as np
+
+from app.executor import run_in_thread
+
+ICONS_PATH = "static/images/icons"
+# Template scales to match at; add e.g. 0.5 or 2.0 for drawings scanned at another scale
+ICON_SCALES = (1.0,)
+MATCH_THRESHOLD = 0.8
+# Detections whose box coordinates are all within this many pixels of a stronger one are duplicates
+MERGE_DISTANCE = 5
+# Images are matched in tiles of this many pixels per side, one thread pool job per tile and template
+MATCH_TILE_SIZE = 1024
+
+
+@lru_cache(maxsize=None)
+def load_icon_templates(base_path: str = ICONS_PATH, scales: Tuple[float, ...] = ICON_SCALES) -> Tuple[Tuple[str, np.ndarray], ...]:
+    """
+    Read every icon in base_path once, convert it to grayscale and resize it to every scale.
+
+    Returns:
+        (file name, grayscale template) pairs, one per icon and scale, with read-only templates.
+    """
+    templates = []
+    for file_name in sorted(os.listdir(base_path)):
+        if not file_name.endswith(('.png', '.jpg', '.jpeg')):
+            continue
+        icon = cv2.imread(os.path.join(base_path, file_name))
+        if icon is None:
+            continue
+        gray_icon = cv2.cvtColor(icon, cv2.COLOR_BGR2GRAY)
+        for scale in scales:
+            template = gray_icon if scale == 1.0 else cv2.resize(gray_icon, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+            template.setflags(write=False)
+            templates.append((file_name, template))
+    return tuple(templates)
+
+
+def match_tile(image: np.ndarray, file_name: str, template: np.ndarray, top: int, left: int) -> List[Dict[str, Any]]:
+    """
+    Match one template against the tile of image whose match positions start at (top, left).
+
+    The tile is extended by the template size minus one, so neighbouring tiles cover every
+    match position of the full image exactly once. BGR tiles are converted to grayscale here.
+    """
+    height, width = template.shape
+    region = image[top:top + MATCH_TILE_SIZE + height - 1, left:left + MATCH_TILE_SIZE + width - 1]
+    if region.shape[0] < height or region.shape[1] < width:
+        return []
+    if region.ndim == 3:
+        region = cv2.cvtColor(region, cv2.COLOR_BGR2GRAY)
+    result = cv2.matchTemplate(region, template, cv2.TM_CCOEFF_NORMED)
+
+    # Keep only local maxima of the response instead of every pixel of each hit blob
+    neighbourhood = np.ones((2 * MERGE_DISTANCE + 1, 2 * MERGE_DISTANCE + 1), dtype=np.uint8)
+    peaks = (result >= MATCH_THRESHOLD) & (result == cv2.dilate(result, neighbourhood))
+    locations = np.where(peaks)
+
+    detected_icons = []
+    for pt in zip(*locations[::-1]):  # Switch x and y
+        confidence = float(result[pt[1], pt[0]])
+        # Original box: (x1, y1, x2, y2)
+        x1, y1 = pt[0] + left, pt[1] + top
+        x2, y2 = x1 + width, y1 + height
+
+        detected_icons.append({
+            "icon_path": file_name,
+            "coordinates": [int(x1), int(y1), int(x2), int(y2)],  # (x1, y1, x2, y2)
+            "confidence": confidence
+        })
+    return detected_icons
+
+
+async def match_icons(image: np.ndarray) -> List[Dict[str, Any]]:
+    """
+    Match every icon template against the grayscale or BGR floorplan and return the raw detections.
+
+    Every (template, tile) pair is a separate job on the thread pool; OpenCV releases the GIL,
+    so they run in parallel. A BGR image is converted tile by tile, so a memory-mapped image is
+    never read or copied in full.
+    """
+    rows, cols = image.shape[:2]
+    jobs = [
+        run_in_thread(match_tile, image, file_name, template, top, left)
+        for file_name, template in load_icon_templates()
+        for top in range(0, rows, MATCH_TILE_SIZE)
+        for left in range(0, cols, MATCH_TILE_SIZE)
+    ]
+    return [icon for detections in await asyncio.gather(*jobs) for icon in detections]
+
+
+def non_max_suppression(boxes: np.ndarray, scores: np.ndarray, threshold: int = MERGE_DISTANCE) -> np.ndarray:
+    """
+    Greedy non-maximum suppression: visit boxes from the highest score down and drop every box
+    whose coordinates are all within threshold of an already kept box.
+
+    Returns:
+        Indices of the kept boxes, highest score first.
+    """
+    order = np.argsort(-scores, kind="stable")
+    boxes = boxes[order]
+    suppressed = np.zeros(len(order), dtype=bool)
+    keep = []
+    for i in range(len(order)):
+        if suppressed[i]:
+            continue
+        keep.append(order[i])
+        suppressed[i + 1:] |= np.all(np.abs(boxes[i + 1:] - boxes[i]) <= threshold, axis=1)
+    return np.array(keep, dtype=np.intp)
+
+
+def suppress_detections(detections: List[Dict[str, Any]], threshold: int = MERGE_DISTANCE) -> List[Dict[str, Any]]:
+    """
+    Deduplicate raw detections: non-maximum suppression per icon class, then once more across
+    classes so that similar templates (e.g. two extinguisher types) cannot claim the same icon.
+    """
+    if not detections:
+        return []
+    names = np.array([icon["icon_path"] for icon in detections])
+    boxes = np.array([icon["coordinates"] for icon in detections])
+    scores = np.array([icon["confidence"] for icon in detections])
+
+    survivors = np.concatenate([
+        np.flatnonzero(names == name)[non_max_suppression(boxes[names == name], scores[names == name], threshold)]
+        for name in np.unique(names)
+    ])
+    survivors = survivors[non_max_suppression(boxes[survivors], scores[survivors], threshold)]
+    # Report the survivors in detection order, which is stable across runs
+    return [detections[i] for i in np.sort(survivors)]
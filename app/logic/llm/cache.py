@@ -0,0 +1,106 @@
+# Cache of fire recommendations, so repeated reports of the same fire skip the model
+import asyncio
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from typing import Awaitable, Callable, Dict, Optional
+
+from cachetools import TTLCache
+
+from app.executor import run_in_thread
+from app.logic.llm.recommendation import FireRecommendations
+
+# Recommendations kept in memory, and how many seconds each stays valid
+RECOMMENDATION_CACHE_SIZE = int(os.environ.get("PATH_HERO_RECOMMENDATION_CACHE_SIZE", 256))
+RECOMMENDATION_TTL = float(os.environ.get("PATH_HERO_RECOMMENDATION_TTL", 30 * 60))
+# Directory of the optional disk tier, which survives restarts and is shared by server processes
+RECOMMENDATION_CACHE_PATH = os.environ.get("PATH_HERO_RECOMMENDATION_CACHE_PATH")
+
+
+def recommendation_key(floorplan_id: str, room: str, description: str) -> str:
+    """
+    Cache key of a fire in room of a floorplan. Descriptions that only differ in case and
+    whitespace share a key.
+    """
+    normalized = " ".join(description.lower().split())
+    return hashlib.sha256(json.dumps([floorplan_id, room, normalized]).encode()).hexdigest()
+
+
+class RecommendationCache:
+    """
+    TTL and LRU bounded recommendations in memory, backed by JSON files in path if one is given.
+
+    Concurrent misses on the same key share one call of the model.
+    """
+
+    def __init__(self, maxsize: int = RECOMMENDATION_CACHE_SIZE, ttl: float = RECOMMENDATION_TTL, path: Optional[str] = RECOMMENDATION_CACHE_PATH):
+        self.ttl = ttl
+        self.path = path
+        self._memory: TTLCache = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._lock = threading.Lock()
+        self._pending: Dict[str, asyncio.Future] = {}
+
+    def _file(self, key: str) -> str:
+        return os.path.join(self.path, f"{key}.json")
+
+    def get(self, key: str) -> Optional[FireRecommendations]:
+        with self._lock:
+            cached = self._memory.get(key)
+        if cached is not None or self.path is None:
+            return cached
+        try:
+            if time.time() - os.path.getmtime(self._file(key)) > self.ttl:
+                return None
+            with open(self._file(key)) as file:
+                cached = FireRecommendations.model_validate_json(file.read())
+        except (OSError, ValueError):
+            return None
+        with self._lock:
+            self._memory[key] = cached
+        return cached
+
+    def put(self, key: str, recommendation: FireRecommendations):
+        with self._lock:
+            self._memory[key] = recommendation
+        if self.path is None:
+            return
+        staging = None
+        try:
+            os.makedirs(self.path, exist_ok=True)
+            descriptor, staging = tempfile.mkstemp(dir=self.path, prefix=".staging-")
+            with os.fdopen(descriptor, "w") as file:
+                file.write(recommendation.model_dump_json())
+            os.replace(staging, self._file(key))
+        except OSError as error:
+            # A full or read-only disk only costs the disk tier; the memory tier already has it
+            print(f"Recommendation not written to disk: {error!r}")
+            if staging is not None and os.path.exists(staging):
+                os.remove(staging)
+
+    async def get_or_create(self, key: str, create: Callable[[], Awaitable[FireRecommendations]]) -> FireRecommendations:
+        """
+        The cached recommendation for key, or the result of create(), which is then cached.
+        """
+        cached = self.get(key) if self.path is None else await run_in_thread(self.get, key)
+        if cached is not None:
+            return cached
+
+        pending = self._pending.get(key)
+        if pending is None:
+            async def create_and_store():
+                try:
+                    recommendation = await create()
+                    await run_in_thread(self.put, key, recommendation)
+                    return recommendation
+                finally:
+                    self._pending.pop(key, None)
+
+            pending = self._pending[key] = asyncio.ensure_future(create_and_store())
+        # A caller that disconnects must not cancel the call the others are waiting for
+        return await asyncio.shield(pending)
+
+
+recommendation_cache = RecommendationCache()
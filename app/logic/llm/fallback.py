@@ -0,0 +1,97 @@
+# Deterministic rule-based fire recommendation, used when the model is unavailable or too slow
+from typing import Any, Dict, List, Tuple
+
+from app.logic.llm.recommendation import FireRecommendations, POSSIBLE_POINTS
+from app.logic.route_cache import rooms_near
+
+# Words of a description or room name that point to a class of fire, checked in this order
+CLASS_KEYWORDS = [
+    ('F', ('kitchen', 'pantry', 'cooking', 'fryer', 'oil pan')),
+    ('D', ('metal', 'magnesium', 'titanium', 'sodium', 'lithium')),
+    ('C', ('electric', 'server', 'switch', 'panel', 'ahu', 'plant', 'transformer', 'battery', 'equipment')),
+    ('B', ('liquid', 'petrol', 'gasoline', 'fuel', 'solvent', 'paint', 'chemical', 'drug', 'pharmacy', 'oxygen', 'gas')),
+    ('A', ('paper', 'wood', 'cloth', 'bed', 'furniture', 'bin', 'rubbish', 'cardboard')),
+]
+# Extinguishers suited to each class of fire, best first
+EXTINGUISHERS = {
+    'A': ('extinguisher_water', 'extinguisher_foam', 'extinguisher_powder'),
+    'B': ('extinguisher_foam', 'extinguisher_powder', 'extinguisher_co2'),
+    'C': ('extinguisher_co2', 'extinguisher_powder'),
+    'D': ('extinguisher_powder',),
+    'E': ('extinguisher_co2', 'extinguisher_powder'),
+    'F': ('extinguisher_foam', 'extinguisher_powder'),
+}
+# Rooms next to the fire that get searched for casualties
+ADJACENT_ROOMS = 2
+
+
+def classify_fire(description: str, room: str) -> str:
+    """
+    Class of fire named by keywords of the description, or else of the room name. 'A' if neither names one.
+    """
+    for text in (description.lower(), room.lower()):
+        for class_of_fire, keywords in CLASS_KEYWORDS:
+            if any(keyword in text for keyword in keywords):
+                return class_of_fire
+    return 'A'
+
+
+def _distance(box: List[int], point: Tuple[int, int]) -> int:
+    # bbox is in (y1, x1, y2, x2)
+    return abs((box[0] + box[2]) // 2 - point[0]) + abs((box[1] + box[3]) // 2 - point[1])
+
+
+def nearest_label(boxes_by_label: Dict[str, List[List[int]]], labels: Tuple[str, ...], point: Tuple[int, int]) -> str:
+    """
+    The label among labels with a bounding box nearest to the (y, x) pixel point, or "" if none of them has one.
+    """
+    candidates = [(_distance(box, point), i, label) for i, label in enumerate(labels) for box in boxes_by_label.get(label, [])]
+    return min(candidates)[2] if candidates else ""
+
+
+def fallback_recommend(coordinates: Dict[str, Any], fire_coordinate: Tuple[int, int], description: str = "") -> FireRecommendations:
+    """
+    Recommendation built from the floorplan alone: the room on fire, the nearest suitable
+    extinguisher and the rooms next to it. The same inputs always give the same result.
+
+    Args:
+        coordinates: Floorplan.coordinates of the floorplan on fire.
+        fire_coordinate: (y, x) pixel coordinate of the fire.
+        description: Description of the fire from the caller.
+
+    Returns:
+        FireRecommendations whose instruction paths only use labels of this floorplan.
+    """
+    icons, rooms = coordinates["icons"], coordinates["rooms"]
+    nearby = rooms_near(coordinates, fire_coordinate)
+    room = nearby[0] if nearby else ""
+    place = room or "fire location"
+    class_of_fire = classify_fire(description, room)
+    extinguisher = nearest_label(icons, EXTINGUISHERS[class_of_fire], fire_coordinate)
+    entry = 'exit' if 'exit' in icons else nearest_label(icons, tuple(POSSIBLE_POINTS[:2]), fire_coordinate)
+    adjacent = nearby[1:1 + ADJACENT_ROOMS]
+
+    steps: List[Tuple[str, List[str]]] = []
+    if class_of_fire == 'C':
+        steps.append((f"Isolate the electrical supply to the {place} before attacking the fire; never use water on it.", []))
+    elif class_of_fire == 'F':
+        steps.append((f"Turn off the gas supply valves of the {place} before attacking the fire.", []))
+    if extinguisher:
+        agent = extinguisher.split('_', 1)[1].replace('co2', 'CO2')
+        steps.append((f"Send 2 people to pick up the nearest {agent} extinguisher and put out the fire in the {place}, searching it for casualties.", [entry, extinguisher, room]))
+    else:
+        steps.append((f"Send 2 people to search the {place} for casualties.", [entry, room]))
+    steps.append((f"Evacuate any casualties from the {place} to the nearest exit, and leave if the fire cannot be contained.", [room, entry]))
+    for name in adjacent:
+        steps.append((f"Send 2 people to search the adjacent {name} for casualties and evacuate them to the nearest exit.", [entry, name, entry]))
+    if 'hosereel' in icons:
+        steps.append(("Send 3 people in fire suits and breathing apparatus to run the hosereel to the fire and take over the attack.", [entry, 'hosereel', room]))
+
+    return FireRecommendations(
+        # Labels this floorplan lacks (e.g. no room was found) cannot be routed to, so they are left out
+        instructions=[text for text, _ in steps],
+        instruction_paths=[[label for label in path if label in icons or label in rooms] for _, path in steps],
+        fire_location=place,
+        class_of_fire=class_of_fire,
+        object_on_fire=description.strip() or f"Contents of the {place}"
+    )
@@ -0,0 +1,145 @@
+# The floorplan image sent with a recommendation prompt: cropped around the fire, downscaled and encoded once
+import math
+import os
+import threading
+from functools import lru_cache
+from typing import Any, Dict, Optional, Tuple
+
+import cv2
+import numpy as np
+from cachetools import LRUCache
+
+from app.logic.route_cache import rooms_near
+
+FIRE_IMAGE_PATH = "static/images/fire.png"
+# Image tokens the prompt image may cost. Gemini bills 258 tokens per 768 x 768 tile, or one
+# tile for images within 384 x 384; the default allows 4 tiles
+PROMPT_IMAGE_TOKENS = int(os.environ.get("PATH_HERO_PROMPT_IMAGE_TOKENS", 4 * 258))
+# Rooms around the fire that the crop keeps in view, counting the room on fire
+PROMPT_ROOMS = 4
+# Pixels of context kept around the fire and those rooms
+PROMPT_MARGIN = 150
+# Format of the prompt image: at quality 90 WebP keeps the labels legible at well under half the size of PNG or JPEG
+PROMPT_IMAGE_MIME_TYPE = "image/webp"
+PROMPT_IMAGE_QUALITY = 90
+# Encoded prompt images kept in memory, keyed by floorplan ID, fire coordinate and token budget
+PROMPT_IMAGE_CACHE_SIZE = 64
+
+_TILE_SIZE, _TILE_TOKENS, _SMALL_IMAGE_SIZE = 768, 258, 384
+
+
+@lru_cache(maxsize=None)
+def load_fire_sprite(path: str = FIRE_IMAGE_PATH) -> np.ndarray:
+    """
+    The fire marker as a read-only BGRA array, read once.
+    """
+    sprite = cv2.imread(path, cv2.IMREAD_UNCHANGED)
+    if sprite.ndim == 2:
+        sprite = cv2.cvtColor(sprite, cv2.COLOR_GRAY2BGRA)
+    elif sprite.shape[2] == 3:
+        sprite = cv2.cvtColor(sprite, cv2.COLOR_BGR2BGRA)
+    sprite.setflags(write=False)
+    return sprite
+
+
+def region_of_interest(
+    shape: Tuple[int, ...],
+    fire_coordinate: Tuple[int, int],
+    coordinates: Optional[Dict[str, Any]] = None
+) -> Tuple[int, int, int, int]:
+    """
+    (y1, x1, y2, x2) box around the fire and the labels of the PROMPT_ROOMS rooms nearest to
+    it, so the model can still read where the fire is. The whole image without coordinates.
+    """
+    height, width = shape[:2]
+    if coordinates is None:
+        return 0, 0, height, width
+    y, x = fire_coordinate
+    y1, x1, y2, x2 = y, x, y, x
+    for name in rooms_near(coordinates, fire_coordinate)[:PROMPT_ROOMS]:
+        # bbox is in (y1, x1, y2, x2)
+        for box in coordinates["rooms"][name]:
+            y1, x1, y2, x2 = min(y1, box[0]), min(x1, box[1]), max(y2, box[2]), max(x2, box[3])
+    return (
+        max(0, y1 - PROMPT_MARGIN), max(0, x1 - PROMPT_MARGIN),
+        min(height, y2 + PROMPT_MARGIN), min(width, x2 + PROMPT_MARGIN)
+    )
+
+
+def fit_to_budget(height: int, width: int, tokens: int = PROMPT_IMAGE_TOKENS) -> float:
+    """
+    Largest scale of at most 1 at which a height x width image costs no more than tokens image tokens.
+    """
+    tiles = tokens // _TILE_TOKENS
+    if tiles < 1:
+        return min(1.0, _SMALL_IMAGE_SIZE / max(height, width))
+    scale = min(1.0, math.sqrt(tiles * _TILE_SIZE ** 2 / (height * width)))
+    while math.ceil(height * scale / _TILE_SIZE) * math.ceil(width * scale / _TILE_SIZE) > tiles:
+        scale *= 0.95
+    return scale
+
+
+def draw_fire(image: np.ndarray, fire_coordinate: Tuple[int, int]):
+    """
+    Blend the fire sprite into the BGR image in place, centred on the (y, x) pixel coordinate.
+    """
+    sprite = load_fire_sprite()
+    top, left = fire_coordinate[0] - sprite.shape[0] // 2, fire_coordinate[1] - sprite.shape[1] // 2
+    y1, x1 = max(0, top), max(0, left)
+    y2, x2 = min(image.shape[0], top + sprite.shape[0]), min(image.shape[1], left + sprite.shape[1])
+    if y1 >= y2 or x1 >= x2:
+        return
+    patch = sprite[y1 - top:y2 - top, x1 - left:x2 - left]
+    alpha = patch[:, :, 3:].astype(np.float32) / 255
+    region = image[y1:y2, x1:x2]
+    region[:] = (patch[:, :, :3] * alpha + region * (1 - alpha)).astype(np.uint8)
+
+
+def encode_prompt_image(
+    image: np.ndarray,
+    fire_coordinate: Tuple[int, int],
+    coordinates: Optional[Dict[str, Any]] = None,
+    tokens: int = PROMPT_IMAGE_TOKENS
+) -> bytes:
+    """
+    The region of interest of the BGR floorplan with the fire marked on it, downscaled to the
+    token budget and encoded as PROMPT_IMAGE_MIME_TYPE. Only the region is copied, so a
+    memory-mapped floorplan is never read in full.
+    """
+    y1, x1, y2, x2 = region_of_interest(image.shape, fire_coordinate, coordinates)
+    crop = np.array(image[y1:y2, x1:x2])
+    if crop.ndim == 2:
+        crop = cv2.cvtColor(crop, cv2.COLOR_GRAY2BGR)
+    draw_fire(crop, (fire_coordinate[0] - y1, fire_coordinate[1] - x1))
+    scale = fit_to_budget(*crop.shape[:2], tokens=tokens)
+    if scale < 1:
+        size = (max(1, round(crop.shape[1] * scale)), max(1, round(crop.shape[0] * scale)))
+        crop = cv2.resize(crop, size, interpolation=cv2.INTER_AREA)
+    _, encoded = cv2.imencode(".webp", crop, [cv2.IMWRITE_WEBP_QUALITY, PROMPT_IMAGE_QUALITY])
+    return encoded.tobytes()
+
+
+_prompt_images: LRUCache = LRUCache(maxsize=PROMPT_IMAGE_CACHE_SIZE)
+_prompt_images_lock = threading.Lock()
+
+
+def prompt_image(
+    image: np.ndarray,
+    fire_coordinate: Tuple[int, int],
+    coordinates: Optional[Dict[str, Any]] = None,
+    floorplan_id: Optional[str] = None,
+    tokens: int = PROMPT_IMAGE_TOKENS
+) -> bytes:
+    """
+    encode_prompt_image, cached by floorplan_id when one is given.
+    """
+    if floorplan_id is None:
+        return encode_prompt_image(image, fire_coordinate, coordinates, tokens)
+    key = (floorplan_id, tuple(fire_coordinate), tokens)
+    with _prompt_images_lock:
+        encoded = _prompt_images.get(key)
+    if encoded is None:
+        encoded = encode_prompt_image(image, fire_coordinate, coordinates, tokens)
+        with _prompt_images_lock:
+            _prompt_images[key] = encoded
+    return encoded
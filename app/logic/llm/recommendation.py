@@ -1,12 +1,22 @@
+import asyncio
 import os
+import threading
 from enum import Enum
+from typing import Optional, Dict, Any, AsyncIterator, Tuple
 
 import cv2
-from PIL import Image
 from google import genai
-from google.genai import types
+from google.genai import errors, types
 from pydantic import BaseModel
 
+from app.executor import run_in_thread
+from app.logic.llm.prompt_image import prompt_image, PROMPT_IMAGE_MIME_TYPE
+from app.logic.llm.stream_parser import JSONStreamParser
+
+RECOMMENDATION_MODEL = 'gemini-2.0-flash-exp'
+# Seconds a fire report waits for the model before the fallback recommendation is used instead
+RECOMMENDATION_TIMEOUT = float(os.environ.get("PATH_HERO_RECOMMENDATION_TIMEOUT", 20))
+
 POSSIBLE_POINTS = [
     'exit',
     'exit_lift',
@@ -40,19 +50,10 @@ class FireRecommendations(BaseModel):
     object_on_fire: str
 
 
-async def recommend(image: cv2.typing.MatLike, fire_coordinate: tuple[int, int]) -> FireRecommendations:
-    """Use it like this: recommend(cv2.imread('static/images/floor/hospital_simple.png'), (y, x))"""
-    """If you already have a cv2_image, use: recommend(cv2_image, (y, x))"""
-    client = genai.Client(api_key=os.environ.get('GEMINI_API_KEY'))
-    # Convert cv2 image from BGR to RGB, then cast it to PIL image for gemini api
-    image = Image.fromarray(cv2.cvtColor(image, cv2.COLOR_BGR2RGB))
-    fire_image_path = "static/images/fire.png"
-    fire_image = Image.open(fire_image_path)
-    image.paste(fire_image, (fire_coordinate[1] - fire_image.height // 2, fire_coordinate[0] - fire_image.width // 2))
-    # image.show()
-
-    prompt = f"""
+def recommendation_prompt(description: str) -> str:
+    return f"""
     Find the location of the fire in the image.
+    Description of the fire from the caller (may be empty): {description}
     Output object on fire. If no info given, consider what is likely to catch fire in the location.
     Output the class of fire. if it is unknown, consider what class the object is ('A' if have plenty of solids like paper, 'B' if the room has flammable liquid, etc). 
     Give me a list of instructions for firefighting, along with the list of paths to take for each respective instruction (EMPTY list with 0 elements if this step does not require a path).
@@ -110,11 +111,156 @@ async def recommend(image: cv2.typing.MatLike, fire_coordinate: tuple[int, int])
     - In kitchens, turn off gas supply valves immediately to prevent gas-fed fires before attempting to extinguish flames
     - In medical storage rooms, identify and isolate oxygen tanks or medical gases to prevent explosions
     """
-    response = client.models.generate_content(model='gemini-2.0-flash-exp', contents=[image, prompt],
-                                              config=types.GenerateContentConfig(
-                                                  response_mime_type="application/json",
-                                                  response_schema=FireRecommendations,
-                                                  temperature=1.3
-                                              ))
+
+
+class RecommendationUnavailable(Exception):
+    """The model gave no recommendation: no API key is set, the call failed or it ran out of time."""
+
+
+_client: Optional[genai.Client] = None
+
+
+def client() -> genai.Client:
+    """
+    The Gemini client shared by every request, created on first use.
+    Raises RecommendationUnavailable if GEMINI_API_KEY is not set.
+    """
+    global _client
+    if _client is None:
+        api_key = os.environ.get('GEMINI_API_KEY')
+        if not api_key:
+            raise RecommendationUnavailable("GEMINI_API_KEY is not set")
+        # The HTTP timeout also frees the SDK's worker thread once the deadline has passed
+        _client = genai.Client(api_key=api_key, http_options={"timeout": RECOMMENDATION_TIMEOUT})
+    return _client
+
+
+async def recommend(
+    image: cv2.typing.MatLike,
+    fire_coordinate: tuple[int, int],
+    description: str = "",
+    timeout: float = RECOMMENDATION_TIMEOUT,
+    coordinates: Optional[Dict[str, Any]] = None,
+    floorplan_id: Optional[str] = None
+) -> FireRecommendations:
+    """Use it like this: recommend(cv2.imread('static/images/floor/hospital_simple.png'), (y, x))"""
+    """If you already have a cv2_image, use: recommend(cv2_image, (y, x))"""
+    # Raises RecommendationUnavailable without an answer within timeout seconds, see fallback.fallback_recommend
+    # With the floorplan's coordinates the prompt image is cropped to the fire and its rooms, see prompt_image
+    try:
+        return await asyncio.wait_for(_generate(client(), image, fire_coordinate, description, coordinates, floorplan_id), timeout)
+    except (asyncio.TimeoutError, errors.APIError, OSError, ValueError) as error:
+        raise RecommendationUnavailable(f"No recommendation from the model: {error!r}") from error
+
+
+async def _generate(
+    client: genai.Client,
+    image: cv2.typing.MatLike,
+    fire_coordinate: tuple[int, int],
+    description: str,
+    coordinates: Optional[Dict[str, Any]],
+    floorplan_id: Optional[str]
+) -> FireRecommendations:
+    # The floorplan with the fire marked on it, encoded once off the event loop
+    image = types.Part.from_bytes(
+        await run_in_thread(prompt_image, image, fire_coordinate, coordinates, floorplan_id),
+        mime_type=PROMPT_IMAGE_MIME_TYPE
+    )
+
+    prompt = recommendation_prompt(description)
+    response = await client.aio.models.generate_content(model=RECOMMENDATION_MODEL, contents=[image, prompt],
+                                                        config=types.GenerateContentConfig(
+                                                            response_mime_type="application/json",
+                                                            response_schema=FireRecommendations,
+                                                            temperature=1.3
+                                                        ))
     # return response.text
     return FireRecommendations.model_validate_json(response.text)
+
+
+# Schema of streamed recommendations: the fire first, then one step per instruction with its path, so that
+# every step is usable as soon as it is complete. A REST schema, as the SDK cannot convert nested models
+STEPS_SCHEMA = {
+    "type": "OBJECT",
+    "properties": {
+        "fire_location": {"type": "STRING"},
+        "class_of_fire": {"type": "STRING"},
+        "object_on_fire": {"type": "STRING"},
+        "steps": {
+            "type": "ARRAY",
+            "items": {
+                "type": "OBJECT",
+                "properties": {"text": {"type": "STRING"}, "path": {"type": "ARRAY", "items": {"type": "STRING"}}},
+                "required": ["text", "path"],
+                "propertyOrdering": ["text", "path"]
+            }
+        }
+    },
+    "required": ["fire_location", "class_of_fire", "object_on_fire", "steps"],
+    "propertyOrdering": ["fire_location", "class_of_fire", "object_on_fire", "steps"]
+}
+STEPS_PROMPT = """
+    Output format: instead of separate instructions and instruction_paths lists, output steps, one {"text": instruction, "path": instruction path} object per instruction, in the same order.
+    """
+
+
+def _stream_chunks(client: genai.Client, contents: list, loop: asyncio.AbstractEventLoop, chunks: asyncio.Queue, stop: threading.Event):
+    # The SDK reads streamed responses with blocking calls, so this runs on the thread pool and hands the
+    # text to the event loop: every chunk, then an exception if the call failed, then None
+    try:
+        for response in client.models.generate_content_stream(model=RECOMMENDATION_MODEL, contents=contents,
+                                                              config=types.GenerateContentConfig(
+                                                                  response_mime_type="application/json",
+                                                                  response_schema=STEPS_SCHEMA,
+                                                                  temperature=1.3
+                                                              )):
+            if stop.is_set():
+                return
+            loop.call_soon_threadsafe(chunks.put_nowait, response.text or "")
+    except Exception as error:
+        loop.call_soon_threadsafe(chunks.put_nowait, error)
+    finally:
+        loop.call_soon_threadsafe(chunks.put_nowait, None)
+
+
+async def recommend_steps(
+    image: cv2.typing.MatLike,
+    fire_coordinate: tuple[int, int],
+    description: str = "",
+    timeout: float = RECOMMENDATION_TIMEOUT,
+    coordinates: Optional[Dict[str, Any]] = None,
+    floorplan_id: Optional[str] = None
+) -> AsyncIterator[Tuple[str, Any]]:
+    """
+    Streaming recommend(): yields ("fire_location" | "class_of_fire" | "object_on_fire", value) and
+    ("step", Step) as soon as the model has generated each of them.
+
+    Raises RecommendationUnavailable, possibly after some steps, without a complete answer within timeout seconds.
+    """
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    chunks: asyncio.Queue = asyncio.Queue()
+    stop = threading.Event()
+    try:
+        image = types.Part.from_bytes(
+            await asyncio.wait_for(run_in_thread(prompt_image, image, fire_coordinate, coordinates, floorplan_id), timeout),
+            mime_type=PROMPT_IMAGE_MIME_TYPE
+        )
+        contents = [image, recommendation_prompt(description) + STEPS_PROMPT]
+        # The stream blocks on the network for as long as the model writes, so it runs on the
+        # default executor like the client's own async calls, not on the CPU-bound thread pool
+        asyncio.ensure_future(asyncio.to_thread(_stream_chunks, client(), contents, loop, chunks, stop))
+        parser = JSONStreamParser()
+        while (chunk := await asyncio.wait_for(chunks.get(), deadline - loop.time())) is not None:
+            if isinstance(chunk, Exception):
+                raise chunk
+            for event, key, value in parser.feed(chunk):
+                if event == "item" and key == "steps":
+                    yield "step", Step.model_validate(value)
+                elif event == "member" and key != "steps":
+                    yield key, value
+    except (asyncio.TimeoutError, errors.APIError, OSError, ValueError) as error:
+        raise RecommendationUnavailable(f"No recommendation from the model: {error!r}") from error
+    finally:
+        # Abandoned streams stop at their next chunk
+        stop.set()
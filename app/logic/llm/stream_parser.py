@@ -0,0 +1,71 @@
+# Incremental parser of a JSON object that arrives in chunks, such as a streamed model response
+import json
+from typing import Any, List, Optional, Tuple
+
+
+class JSONStreamParser:
+    """
+    Parses one JSON object fed in arbitrary chunks, reporting values as soon as they are complete:
+
+    - ("member", key, value) for every member of the object, once its value is complete;
+    - ("item", key, value) for every element of a member that is an array, before the whole
+      array is complete, so long lists can be used while the rest is still arriving.
+
+    Only the structure is tracked while scanning; each complete value is parsed with json.loads.
+    """
+
+    def __init__(self):
+        self._text = ""
+        self._position = 0
+        self._stack: List[str] = []  # Open containers, '{' or '['
+        self._in_string = False
+        self._escaped = False
+        self._key: Optional[str] = None
+        self._string_start = 0
+        self._value_start: Optional[int] = None  # Of the current member of the object
+        self._item_start = 0  # Of the current element of an array member
+
+    def feed(self, chunk: str) -> List[Tuple[str, str, Any]]:
+        """
+        Add the next chunk of text and return the events it completes, in order.
+        """
+        self._text += chunk
+        events = []
+        while self._position < len(self._text):
+            i, char = self._position, self._text[self._position]
+            self._position += 1
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == '\\':
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+                    if len(self._stack) == 1 and self._value_start is None:
+                        self._key = json.loads(self._text[self._string_start:i + 1])
+                continue
+
+            depth = len(self._stack)
+            if char == '"':
+                self._in_string = True
+                self._string_start = i
+            elif char == ':' and depth == 1:
+                self._value_start = self._position
+            elif char in '{[':
+                self._stack.append(char)
+                if depth == 1 and char == '[':
+                    self._item_start = self._position
+            elif char in ',]}':
+                if depth == 2 and self._stack[1] == '[' and char != '}':
+                    # The end of an element of an array member
+                    item = self._text[self._item_start:i].strip()
+                    if item:
+                        events.append(("item", self._key, json.loads(item)))
+                    self._item_start = self._position
+                if depth == 1 and self._value_start is not None:
+                    # The end of a member of the object
+                    events.append(("member", self._key, json.loads(self._text[self._value_start:i])))
+                    self._value_start = None
+                if char != ',':
+                    self._stack.pop()
+        return events
@@ -0,0 +1,171 @@
+# Room label extraction: OCR of the dark text pixels of a floorplan, in parallel tiles for large drawings
+import asyncio
+from typing import Tuple, List, Dict, Any
+
+import numpy as np
+from PIL import Image
+import pytesseract
+
+from app.executor import run_in_thread
+
+# Pixels at least this bright are whitened before OCR, leaving only the black text
+TEXT_THRESHOLD = 50
+# Words tesseract is less confident about than this are dropped
+MIN_WORD_CONFIDENCE = 50
+# Images larger than this many pixels per side are read in tiles of this size, one tesseract run per tile
+OCR_TILE_SIZE = 2048
+# Tiles are extended by this many pixels on every side; must exceed the longest word on the drawing
+OCR_TILE_OVERLAP = 256
+# Tiles without a single text pixel are not sent to tesseract
+SKIP_BLANK_TILES = True
+
+
+def filter_text_pixels(image_array: np.ndarray) -> np.ndarray:
+    """
+    Grayscale copy of the image with every pixel that is not near-black turned white.
+    """
+    image_array = np.array(Image.fromarray(image_array).convert("L"))
+    return np.where(image_array < TEXT_THRESHOLD, image_array, 255).astype(np.uint8)
+
+
+def read_words(
+    image_array: np.ndarray,
+    bounds: Tuple[int, int, int, int],
+    core: Tuple[int, int, int, int],
+    skip_blank: bool = SKIP_BLANK_TILES
+) -> List[Dict[str, Any]]:
+    """
+    OCR the (top, left, bottom, right) bounds of image_array and keep the confident words
+    whose centre lies in core, so words on a seam are only reported by one tile.
+
+    Only this tile is filtered, so a memory-mapped image is read one tile at a time.
+
+    Returns:
+        Words as {'text', 'coordinates': (x1, y1, x2, y2)} in full image pixels.
+    """
+    top, left, bottom, right = bounds
+    core_top, core_left, core_bottom, core_right = core
+    filtered_tile = filter_text_pixels(image_array[top:bottom, left:right])
+    if skip_blank and not (filtered_tile < TEXT_THRESHOLD).any():
+        return []
+    data = pytesseract.image_to_data(Image.fromarray(filtered_tile), output_type=pytesseract.Output.DICT)
+
+    bounding_boxes = []
+    for i in range(len(data['text'])):
+        text = data['text'][i]
+        try:
+            conf = float(data['conf'][i])
+            if text.strip() and conf > MIN_WORD_CONFIDENCE:  # Filter low-confidence text
+                x, y, w, h = (data['left'][i] + left, data['top'][i] + top,
+                              data['width'][i], data['height'][i])
+                if not (core_top <= y + h // 2 < core_bottom and core_left <= x + w // 2 < core_right):
+                    continue
+                # Save coordinates as (x, y, x+w, y+h)
+                bounding_boxes.append({
+                    'text': text,
+                    'coordinates': (int(x), int(y), int(x + w), int(y + h))
+                })
+        except ValueError:
+            continue
+    return bounding_boxes
+
+
+async def extract_text_with_boxes(
+    image_array: np.ndarray,
+    tile_size: int = OCR_TILE_SIZE,
+    overlap: int = OCR_TILE_OVERLAP,
+    skip_blank_tiles: bool = SKIP_BLANK_TILES
+) -> List[Dict[str, Any]]:
+    """
+    Extract text and bounding boxes from the image using pytesseract, and combine nearby words.
+
+    Images up to tile_size pixels per side are read in one pass. Larger images are cut into
+    overlapping tiles that are read in parallel on the thread pool; every tile is a separate
+    tesseract process, so this uses all cores.
+    """
+    rows, cols = image_array.shape[:2]
+
+    jobs = []
+    for core_top in range(0, rows, tile_size):
+        for core_left in range(0, cols, tile_size):
+            core = (core_top, core_left, min(rows, core_top + tile_size), min(cols, core_left + tile_size))
+            bounds = (max(0, core[0] - overlap), max(0, core[1] - overlap), min(rows, core[2] + overlap), min(cols, core[3] + overlap))
+            jobs.append(run_in_thread(read_words, image_array, bounds, core, skip_blank_tiles))
+    words = [word for tile_words in await asyncio.gather(*jobs) for word in tile_words]
+
+    # Combine nearby bounding boxes
+    return await run_in_thread(combine_bounding_boxes, words)
+
+
+def combine_bounding_boxes(bounding_boxes, distance_threshold=50):
+    """
+    Combine bounding boxes that are close to each other.
+
+    Every box grows by absorbing, in list order, the later boxes within distance_threshold of it.
+    Boxes are bucketed in a uniform grid of distance_threshold sized cells, so each step only
+    checks the boxes around the growing box instead of every box.
+    """
+    cell_size = max(1, distance_threshold)
+    buckets = {}
+    for j, box in enumerate(bounding_boxes):
+        x1, y1, x2, y2 = box['coordinates']
+        for cell_y in range(y1 // cell_size, y2 // cell_size + 1):
+            for cell_x in range(x1 // cell_size, x2 // cell_size + 1):
+                buckets.setdefault((cell_y, cell_x), []).append(j)
+
+    def nearby(coords):
+        x1, y1, x2, y2 = coords
+        return {
+            j
+            for cell_y in range((y1 - distance_threshold) // cell_size, (y2 + distance_threshold) // cell_size + 1)
+            for cell_x in range((x1 - distance_threshold) // cell_size, (x2 + distance_threshold) // cell_size + 1)
+            for j in buckets.get((cell_y, cell_x), ())
+        }
+
+    combined_boxes = []
+    used = set()
+
+    for i, box1 in enumerate(bounding_boxes):
+        if i in used:
+            continue
+        combined_text = box1['text']
+        combined_coords = list(box1['coordinates'])
+        used.add(i)
+
+        # Next box to absorb: the first unused box after the last absorbed one that is close enough
+        last = i
+        while True:
+            candidates = [
+                j for j in nearby(combined_coords)
+                if j > last and j not in used
+                and calculate_distance(combined_coords, bounding_boxes[j]['coordinates']) < distance_threshold
+            ]
+            if not candidates:
+                break
+            last = min(candidates)
+            box2 = bounding_boxes[last]
+            combined_text += f" {box2['text']}"
+            x1, y1, x2, y2 = combined_coords
+            x3, y3, x4, y4 = box2['coordinates']
+            combined_coords = [
+                min(x1, x3), 
+                min(y1, y3), 
+                max(x2, x4), 
+                max(y2, y4)
+            ]
+            used.add(last)
+
+        # Ensure coordinates are native ints
+        combined_boxes.append({
+            'text': combined_text,
+            'coordinates': (int(combined_coords[0]), int(combined_coords[1]), 
+                            int(combined_coords[2]), int(combined_coords[3]))
+        })
+
+    return combined_boxes
+
+def calculate_distance(box1, box2):
+    """Calculate distance between two bounding boxes."""
+    x1, y1, x2, y2 = box1
+    x3, y3, x4, y4 = box2
+    return max(0, max(x3 - x2, x1 - x4)) + max(0, max(y3 - y2, y1 - y4))
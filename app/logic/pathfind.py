@@ -1,50 +1,61 @@
 # Path finding logic to be used in both endpoints
 import heapq
+import cv2
 import numpy as np
-import app.globals as globals
+from functools import lru_cache
 
-from app.logic.filter_walls import filter_walls_as_image
+from app.logic.filter_walls import wall_mask
 
 from PIL import Image
 from typing import Tuple, List, Optional, Dict, Any
 
+# Distance value for cells that no source can reach
+UNREACHABLE = np.iinfo(np.int32).max
+
+# Hazard weighting around fire zones: entering a cell d grid cells away from a fire zone costs
+# 1 + FIRE_DANGER_WEIGHT * (FIRE_DANGER_RADIUS - d) ** 2 when d < FIRE_DANGER_RADIUS, and 1 otherwise
+FIRE_DANGER_RADIUS = 20
+FIRE_DANGER_WEIGHT = 1
+# Cost of entering a cell inside a fire zone: far above any detour, so routes only cross a zone
+# where they have to, to reach or leave a place inside it, and then by the shortest way through
+FIRE_ZONE_COST = 100_000
+
+# Rows of grid cells that build_grid converts per pass, which bounds its full resolution scratch memory
+GRID_BAND_ROWS = 16
+
 
 def convert_image_to_grid(
     image: Image.Image,
     grid_size: int
-) -> List[List[int]]:
+) -> np.ndarray:
     """
     Convert a cleaned image into a grid representation.
 
+    Every grid cell is a grid_size x grid_size tile of the image; the tiles are reduced all at once
+    through a reshaped view. Pixels past the last whole tile on the right and bottom edges are dropped.
+
     Args:
-        image: Cleaned input image as a PIL Image.
+        image: Cleaned input image as a PIL Image or NumPy array.
         grid_size: Size of each grid cell in pixels.
 
     Returns:
-        2D grid where 1 represents traversable space, and 0 represents obstacles.
+        2D uint8 grid where 1 represents traversable space, and 0 represents obstacles.
     """
-    image_array = np.array(image)  # Convert to NumPy array
+    image_array = np.asarray(image)
     rows, cols = image_array.shape[:2]
-    
+
     # Calculate the grid dimensions
     grid_rows = rows // grid_size
     grid_cols = cols // grid_size
 
-    # Initialize the grid
-    grid = np.zeros((grid_rows, grid_cols), dtype=int)
+    # View the whole tiles as (grid_rows, grid_size, grid_cols, grid_size[, channels])
+    tiles = image_array[:grid_rows * grid_size, :grid_cols * grid_size].reshape(
+        grid_rows, grid_size, grid_cols, grid_size, *image_array.shape[2:]
+    )
 
-    # Fill the grid: A cell is traversable (1) if all its pixels are white
-    for i in range(grid_rows):
-        for j in range(grid_cols):
-            sub_region = image_array[
-                i * grid_size : (i + 1) * grid_size,
-                j * grid_size : (j + 1) * grid_size
-            ]
-            # Check if all pixels are white (255, 255, 255)
-            if np.all(sub_region == 255):
-                grid[i, j] = 1  # Traversable
-
-    return grid.tolist()
+    # A cell is traversable (1) if all its pixels are white
+    tile_axes = (1, 3) + tuple(range(4, tiles.ndim))
+    return (tiles == 255).all(axis=tile_axes).astype(np.uint8)
 
 def heuristic_manhattan(a: Tuple[int, int], b: Tuple[int, int]) -> int:
     """
@@ -52,22 +63,6 @@ def heuristic_manhattan(a: Tuple[int, int], b: Tuple[int, int]) -> int:
     """
     return abs(a[0] - b[0]) + abs(a[1] - b[1])
 
-def heuristic_fire(a: Tuple[int, int], b: Tuple[int, int], fire_coords: Optional[List[Tuple[int, int]]] = None) -> int:
-    """
-    Calculate the Manhattan distance between two points a and b, with a penalty for proximity to fire coordinates.
-    """
-    base_distance = abs(a[0] - b[0]) + abs(a[1] - b[1])
-    penalty = 0
-
-    if fire_coords:
-        for fx, fy in fire_coords:
-            fire_distance = abs(a[0] - fx) + abs(a[1] - fy)
-            penalty += max(0, (20 - fire_distance) ** 2)
-            if fire_distance < 50:  # Threshold (adjust as needed)
-                penalty += 1e12
-
-    return base_distance + penalty
-
 def pixel_to_grid(pixel_coord: Tuple[int, int], grid_size: int) -> Tuple[int, int]:
     """
     Convert pixel coordinates to grid coordinates.
@@ -81,87 +76,521 @@ def grid_to_pixel(grid_coord: Tuple[int, int], grid_size: int) -> Tuple[int, int
     return grid_coord[0] * grid_size + grid_size // 2, grid_coord[1] * grid_size + grid_size // 2
 
 
+def _as_occupancy(grid: Any) -> np.ndarray:
+    """
+    Return the grid as a 2D uint8 array (1 = traversable, 0 = obstacle).
+
+    Lists of lists are converted once per call; arrays that are already uint8 are used as is.
+    """
+    return np.asarray(grid, dtype=np.uint8)
+
+def _heuristic_field(shape: Tuple[int, int], goals: List[Tuple[int, int]]) -> np.ndarray:
+    """
+    Precompute the Manhattan distance to the nearest goal for every cell at once instead of per expanded neighbour.
+
+    Every step costs at least 1, so this stays admissible and consistent on fire-weighted grids too.
+    """
+    rows, cols = shape
+    row_index = np.arange(rows)[:, None]
+    col_index = np.arange(cols)[None, :]
+
+    field = np.full(shape, UNREACHABLE, dtype=np.int32)
+    for gr, gc in goals:
+        np.minimum(field, np.abs(row_index - gr) + np.abs(col_index - gc), out=field)
+    return field
+
+def _reconstruct_path(parent: np.ndarray, end: int, cols: int) -> List[Tuple[int, int]]:
+    """
+    Walk the parent-index array back from end and return the path as (row, col) tuples, start first.
+
+    Indices are into the padded search arrays, so one border cell is removed from each coordinate.
+    """
+    path = []
+    current = end
+    while current != -1:
+        r, c = divmod(current, cols)
+        path.append((r - 1, c - 1))
+        current = int(parent[current])
+    return path[::-1]
+
 def a_star_pathfinding(
     grid: List[List[int]],
     start: Tuple[int, int],
     goals: List[Tuple[int, int]],
-    heuristic: bool, # true means heuristic_fire, false means heuristic_manhattan
-    fire_coords: Optional[List[Tuple[int, int]]] = None
+    heuristic: bool, # true means fire-weighted traversal costs around the fire zones (see fire_cost_field), false means only the zones cost more
+    fire_coords: Optional[List[Tuple[int, int]]] = None,
+    fire_size: str = "s",
+    method: str = "astar",
+    fire_costs: Optional[np.ndarray] = None
 ) -> tuple[float, list[Any]]:
     """
     A* pathfinding algorithm to find the shortest path from start to the nearest goal.
 
+    Fire zones cost FIRE_ZONE_COST per cell to enter, so routes stay out of them unless the start
+    or a goal is inside one; with heuristic=True the cells around them also cost more to enter.
+    The Manhattan heuristic keeps the result optimal for those costs.
+
+    method="jps" switches to Jump Point Search, which returns paths of the same cost with far fewer
+    heap operations on open floor plans. It needs uniform costs, so searches with fire_coords or
+    fire_costs always use plain A*.
+
     Args:
         grid: 2D grid representation of the map (0 = obstacle, 1 = traversable).
         start: Starting coordinate (x, y).
         goals: List of goal coordinates [(x1, y1), (x2, y2), ...].
-        heuristic: Boolean to determine heuristic function to use for pathfinding.
-        fire_coords: Optional list of fire coordinates [(fx1, fy1), (fx2, fy2), ...].
+        heuristic: Boolean to also weight traversal costs by proximity to the fire zones.
+        fire_coords: Optional list of fire coordinates in pixels [(fy1, fx1), (fy2, fx2), ...].
+        fire_size: Size of the fires ("s" for small, "l" for large).
+        method: "astar" or "jps".
+        fire_costs: Optional fire_cost_field of the grid, used instead of one built from fire_coords,
+            so searches for the same fires can share it.
 
     Returns:
-        List of coordinates representing the shortest path from start to the nearest goal.
+        Cost of the path and the list of coordinates representing the shortest path from start to the nearest goal.
     """
-    rows, cols = len(grid), len(grid[0])
+    return _search(grid, [start], goals, heuristic, fire_coords, fire_size, method, fire_costs)
 
-    if fire_coords:
-        grid = mark_fire_zones(grid, fire_coords, fire_proximity_threshold=150, fire_size="s", grid_size=10)
-
-    def is_within_bounds(coord):
-        x, y = coord
-        return 0 <= x < rows and 0 <= y < cols
-
-    def is_traversable(coord):
-        x, y = coord
-        return grid[x][y] == 1
+def multi_target_pathfinding(
+    grid: List[List[int]],
+    starts: List[Tuple[int, int]],
+    goals: List[Tuple[int, int]],
+    heuristic: bool,
+    fire_coords: Optional[List[Tuple[int, int]]] = None,
+    fire_size: str = "s",
+    method: str = "astar",
+    fire_costs: Optional[np.ndarray] = None
+) -> tuple[float, int, int, list[Any]]:
+    """
+    Shortest path between any of the starts and any of the goals, found with a single search.
 
-    open_set = []
-    heapq.heappush(open_set, (0, start))  # Priority queue with (cost, coordinate)
+    All starts are seeded at cost 0 and the search stops at the first goal it settles, which gives
+    the same answer as running a_star_pathfinding for every start-goal pair and taking the minimum.
+    Arguments are the same as a_star_pathfinding, with a list of starts.
 
-    heuristic_func = heuristic_fire if heuristic else heuristic_manhattan
-    came_from = {}
-    g_score = {start: 0}
-    f_score = {start: min(heuristic_func(start, goal) for goal in goals)}
+    Returns:
+        Cost of the path, index of its start in starts, index of its goal in goals (-1 for both if
+        there is no path), and the list of coordinates of the path.
+    """
+    distance, path = _search(grid, starts, goals, heuristic, fire_coords, fire_size, method, fire_costs)
+    if not path:
+        return distance, -1, -1, path
+    starts = [(int(r), int(c)) for r, c in starts]
+    goals = [(int(r), int(c)) for r, c in goals]
+    return distance, starts.index(path[0]), goals.index(path[-1]), path
+
+def _search(
+    grid: List[List[int]],
+    starts: List[Tuple[int, int]],
+    goals: List[Tuple[int, int]],
+    heuristic: bool,
+    fire_coords: Optional[List[Tuple[int, int]]],
+    fire_size: str,
+    method: str,
+    fire_costs: Optional[np.ndarray]
+) -> tuple[float, list[Any]]:
+    """
+    Shared search behind a_star_pathfinding and multi_target_pathfinding.
 
-    directions = [(0, 1), (1, 0), (0, -1), (-1, 0)]  # Right, Down, Left, Up
+    The search runs on flat NumPy arrays indexed by row * cols + col: an int32 cost array,
+    an int32 parent-index array and a uint8 closed set, with a heap of integer cell indices.
+    The arrays carry a one-cell obstacle border so neighbours never need a bounds check.
+    """
+    occupancy = _as_occupancy(grid)
+    rows, cols = occupancy.shape
+
+    start_cells = [(int(r), int(c)) for r, c in starts if 0 <= r < rows and 0 <= c < cols]
+    goal_cells = [(int(r), int(c)) for r, c in goals if 0 <= r < rows and 0 <= c < cols]
+    if not start_cells or not goal_cells:
+        return float('inf'), []
+
+    heuristic_field = _heuristic_field((rows, cols), goal_cells)
+
+    padded_cols = cols + 2
+    size = (rows + 2) * padded_cols
+    goal_indices = {(r + 1) * padded_cols + c + 1 for r, c in goal_cells}
+    start_indices = [(r + 1) * padded_cols + c + 1 for r, c in start_cells]
+
+    # 64 bits, as routes through fire zones add up FIRE_ZONE_COST per cell
+    g_score_array = np.full(size, np.iinfo(np.int64).max, dtype=np.int64)
+    parent_array = np.full(size, -1, dtype=np.int32)
+    closed_array = np.zeros(size, dtype=np.uint8)
+
+    padded = np.pad(occupancy, 1)
+    # Fire zones are weighted rather than blocked, so a place on fire can still be reached and left
+    step_cost_array = np.ones((rows + 2, padded_cols), dtype=np.int32)
+    if fire_costs is None and fire_coords:
+        fire_costs = fire_cost_field(fire_zone_mask((rows, cols), fire_coords, fire_size=fire_size), weighted=heuristic)
+    if fire_costs is not None:
+        step_cost_array[1:-1, 1:-1] = fire_costs
+
+    # Memoryviews share the arrays' buffers but index to plain Python ints, which keeps the inner loop cheap
+    traversable = memoryview(padded.ravel())
+    step_cost = memoryview(step_cost_array.ravel())
+    estimate = memoryview(np.pad(heuristic_field, 1).ravel())
+    g_score = memoryview(g_score_array)
+    parent = memoryview(parent_array)
+    closed = memoryview(closed_array)
+
+    for start_index in start_indices:
+        g_score[start_index] = 0
+    # Priority queue with (f score, cell index)
+    open_set = [(estimate[start_index], start_index) for start_index in start_indices]
+    heapq.heapify(open_set)
+
+    if method == "jps" and fire_costs is None:
+        goal_mask = np.zeros(padded.shape, dtype=bool)
+        goal_mask.ravel()[list(goal_indices)] = True
+        jump_tables = _jump_tables(padded.astype(bool), goal_mask)
+        end = _jump_point_search(traversable, estimate, g_score, parent, closed, open_set, jump_tables, padded_cols, goal_indices)
+        if end == -1:
+            return float('inf'), []
+        return float(g_score[end]), _expand_jump_points(_reconstruct_path(parent_array, end, padded_cols))
 
     while open_set:
         _, current = heapq.heappop(open_set)
+        if closed[current]:
+            continue  # Stale heap entry
+        closed[current] = 1
 
         # Check if the current node is one of the goals
-        if current in goals:
-            # Reconstruct path
-            path = []
-            while current in came_from:
-                path.append(current)
-                current = came_from[current]
-            path.append(start)
-            return g_score[current], path[::-1]
-
-        for dx, dy in directions:
-            neighbor = (current[0] + dx, current[1] + dy)
-
-            if not is_within_bounds(neighbor) or not is_traversable(neighbor):
-                continue
+        if current in goal_indices:
+            return float(g_score[current]), _reconstruct_path(parent_array, current, padded_cols)
 
-            if fire_coords and neighbor in fire_coords:
-                continue  # Avoid fire cells
+        current_g_score = g_score[current]
 
-            tentative_g_score = g_score[current] + 1
+        # Right, Down, Left, Up
+        for neighbor in (current + 1, current + padded_cols, current - 1, current - padded_cols):
+            if not traversable[neighbor] or closed[neighbor]:
+                continue
 
-            if tentative_g_score < g_score.get(neighbor, float('inf')):
-                came_from[neighbor] = current
+            tentative_g_score = current_g_score + step_cost[neighbor]
+            if tentative_g_score < g_score[neighbor]:
+                parent[neighbor] = current
                 g_score[neighbor] = tentative_g_score
-                f_score[neighbor] = tentative_g_score + min(heuristic_func(neighbor, goal) for goal in goals)
-                heapq.heappush(open_set, (f_score[neighbor], neighbor))
+                heapq.heappush(open_set, (tentative_g_score + estimate[neighbor], neighbor))
 
     return float('inf'), []  # Return an empty path if no path to any goal is found
 
-def initialize_grid(img, grid_size=10):
-    image = filter_walls_as_image(img)
-    globals.grid = convert_image_to_grid(image, grid_size)
+def _jump_table(jump_points: np.ndarray, traversable: np.ndarray, axis: int, forward: bool) -> np.ndarray:
+    """
+    For every cell, the flat index of the first jump point reached by moving along axis
+    (forwards or backwards) before hitting an obstacle, or -1 if an obstacle comes first.
+
+    Both inputs are padded 2D boolean arrays, so every line ends in an obstacle.
+    """
+    if not forward:
+        jump_points, traversable = np.flip(jump_points, axis), np.flip(traversable, axis)
+    length = jump_points.shape[axis]
+    position = np.arange(length).reshape((-1, 1) if axis == 0 else (1, -1))
+
+    def nearest_ahead(mask):
+        # Suffix minimum of the positions where mask holds, shifted so each cell only looks strictly ahead
+        nearest = np.flip(np.minimum.accumulate(np.flip(np.where(mask, position, length), axis), axis=axis), axis)
+        return np.concatenate((np.delete(nearest, 0, axis), np.full_like(np.take(nearest, [0], axis), length)), axis)
+
+    ahead_jump_point = nearest_ahead(jump_points)
+    target = np.where(ahead_jump_point < nearest_ahead(~traversable), ahead_jump_point, -1)
+    if not forward:
+        target = np.flip(np.where(target >= 0, length - 1 - target, -1), axis)
+
+    rows, cols = jump_points.shape
+    if axis == 1:
+        flat = np.arange(rows).reshape(-1, 1) * cols + target
+    else:
+        flat = target * cols + np.arange(cols).reshape(1, -1)
+    return np.where(target >= 0, flat, -1).astype(np.int32).ravel()
+
+def _jump_tables(traversable: np.ndarray, goals: np.ndarray) -> Dict[int, memoryview]:
+    """
+    Precomputed jumps (JPS+ style) for the four directions of a padded 4-connected grid, keyed by flat index step.
+
+    A cell is a jump point when it is a goal, or has a forced neighbour (an open side cell whose
+    cell behind is blocked), or, for vertical moves, when a horizontal jump from it finds a jump point.
+    """
+    cols = traversable.shape[1]
+
+    def shifted(rows, columns):
+        # Value of the cell at (r - rows, c - columns); the padding makes the wrap-around land on obstacles
+        return np.roll(traversable, (rows, columns), axis=(0, 1))
+
+    def forced(side, behind):
+        return (shifted(*side) & ~shifted(side[0] + behind[0], side[1] + behind[1])) | \
+            (shifted(-side[0], -side[1]) & ~shifted(-side[0] + behind[0], -side[1] + behind[1]))
+
+    right = _jump_table(traversable & (goals | forced((1, 0), (0, 1))), traversable, axis=1, forward=True)
+    left = _jump_table(traversable & (goals | forced((1, 0), (0, -1))), traversable, axis=1, forward=False)
+    horizontal = ((right != -1) | (left != -1)).reshape(traversable.shape)
+    down = _jump_table(traversable & (goals | horizontal | forced((0, 1), (1, 0))), traversable, axis=0, forward=True)
+    up = _jump_table(traversable & (goals | horizontal | forced((0, 1), (-1, 0))), traversable, axis=0, forward=False)
+    return {1: memoryview(right), -1: memoryview(left), cols: memoryview(down), -cols: memoryview(up)}
+
+def _jump_point_search(traversable, estimate, g_score, parent, closed, open_set, jump_tables, padded_cols: int, goal_indices) -> int:
+    """
+    Jump Point Search over the padded search arrays of a_star_pathfinding, for 4-connected uniform-cost grids.
+
+    Only jump points are pushed on the heap; the straight runs between them are skipped with one table lookup.
+
+    Returns:
+        Index of the goal reached (the parent array then links back through the jump points), or -1.
+    """
+    while open_set:
+        _, current = heapq.heappop(open_set)
+        if closed[current]:
+            continue  # Stale heap entry
+        closed[current] = 1
+
+        if current in goal_indices:
+            return current
+
+        # Prune to the natural neighbours for the direction we arrived from
+        if parent[current] == -1:
+            directions = (1, padded_cols, -1, -padded_cols)
+        else:
+            delta = current - parent[current]
+            if abs(delta) < padded_cols:
+                step = 1 if delta > 0 else -1
+                directions = (step, padded_cols, -padded_cols)
+            else:
+                step = padded_cols if delta > 0 else -padded_cols
+                directions = (step, 1, -1)
+
+        current_g_score = g_score[current]
+        for direction in directions:
+            jump_point = jump_tables[direction][current]
+            if jump_point == -1 or closed[jump_point]:
+                continue
+
+            tentative_g_score = current_g_score + abs(jump_point - current) // abs(direction)
+            if tentative_g_score < g_score[jump_point]:
+                parent[jump_point] = current
+                g_score[jump_point] = tentative_g_score
+                heapq.heappush(open_set, (tentative_g_score + estimate[jump_point], jump_point))
+
+    return -1
+
+def _expand_jump_points(jump_points: List[Tuple[int, int]]) -> List[Tuple[int, int]]:
+    """
+    Fill in every cell on the straight runs between consecutive jump points.
+    """
+    path = jump_points[:1]
+    for (r1, c1), (r2, c2) in zip(jump_points, jump_points[1:]):
+        dr, dc = (r2 > r1) - (r2 < r1), (c2 > c1) - (c2 < c1)
+        r, c = r1, c1
+        while (r, c) != (r2, c2):
+            r, c = r + dr, c + dc
+            path.append((r, c))
+    return path
+
+def compute_distance_field(
+    grid: List[List[int]],
+    sources: List[Tuple[int, int]]
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Multi-source breadth-first search from all sources at once.
+
+    The wavefront is expanded one step at a time with vectorized NumPy operations, so the
+    whole field costs about as much as a single A* search.
+
+    Args:
+        grid: 2D grid representation of the map (0 = obstacle, 1 = traversable).
+        sources: List of source coordinates [(x1, y1), (x2, y2), ...].
+
+    Returns:
+        distance: int32 array of steps to the nearest source (UNREACHABLE if no source can be reached).
+        next_hop: int32 array of the flat index (row * cols + col) of the next cell towards that source,
+            -1 for sources and unreachable cells.
+    """
+    occupancy = _as_occupancy(grid)
+    rows, cols = occupancy.shape
+    padded_cols = cols + 2
+    size = (rows + 2) * padded_cols
+
+    traversable = np.pad(occupancy, 1).ravel().astype(bool)
+    distance = np.full(size, UNREACHABLE, dtype=np.int32)
+    next_hop = np.full(size, -1, dtype=np.int32)
+
+    source_cells = [(int(r), int(c)) for r, c in sources if 0 <= r < rows and 0 <= c < cols]
+    source_indices = np.array([(r + 1) * padded_cols + c + 1 for r, c in source_cells], dtype=np.int64)
+    distance[source_indices] = 0
+
+    # Sources on obstacles count as reached, like goals in a_star_pathfinding, but are never expanded
+    frontier = np.unique(source_indices[traversable[source_indices]])
+    step = 0
+    while frontier.size:
+        step += 1
+        candidates = np.concatenate((frontier + 1, frontier + padded_cols, frontier - 1, frontier - padded_cols))
+        parents = np.tile(frontier, 4)
+        fresh = traversable[candidates] & (distance[candidates] == UNREACHABLE)
+        frontier, first = np.unique(candidates[fresh], return_index=True)
+        distance[frontier] = step
+        next_hop[frontier] = parents[fresh][first]
+
+    # Drop the obstacle border and convert padded next-hop indices to unpadded ones
+    distance = distance.reshape(rows + 2, padded_cols)[1:-1, 1:-1]
+    next_hop = next_hop.reshape(rows + 2, padded_cols)[1:-1, 1:-1]
+    next_hop = np.where(next_hop >= 0, (next_hop // padded_cols - 1) * cols + next_hop % padded_cols - 1, -1)
+    return np.ascontiguousarray(distance), next_hop.astype(np.int32)
+
+def patch_distance_field(
+    field: Tuple[np.ndarray, np.ndarray],
+    closed: np.ndarray,
+    opened: np.ndarray
+) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+    """
+    Carry a compute_distance_field result over to a grid on which some cells were closed or opened.
+
+    Closing a cell that no route passes through only removes that cell from the field, and
+    cells opened away from the reached area change nothing. Anything else needs a new search.
+
+    Args:
+        field: (distance, next_hop) from compute_distance_field on the old grid.
+        closed: Flat indices of the cells that became obstacles.
+        opened: Flat indices of the cells that became traversable.
+
+    Returns:
+        The field for the new grid, equal to a recomputed one, or None if it has to be recomputed.
+    """
+    distance, next_hop = field
+    rows, cols = distance.shape
+    flat_distance = distance.ravel()
+
+    reached_closed = closed[flat_distance[closed] != UNREACHABLE]
+    if reached_closed.size and np.isin(next_hop, reached_closed).any():
+        return None
+
+    # An opened cell that is reached itself or touches a reached cell can shorten routes
+    if opened.size:
+        opened_rows, opened_cols = np.divmod(opened, cols)
+        for dr, dc in ((0, 0), (1, 0), (-1, 0), (0, 1), (0, -1)):
+            r, c = opened_rows + dr, opened_cols + dc
+            inside = (r >= 0) & (r < rows) & (c >= 0) & (c < cols)
+            if (distance[r[inside], c[inside]] != UNREACHABLE).any():
+                return None
+
+    # Closed sources stay reached, as in compute_distance_field; other closed cells drop out
+    dropped = reached_closed[flat_distance[reached_closed] != 0]
+    if not dropped.size:
+        return field
+    distance, next_hop = distance.copy(), next_hop.copy()
+    distance.ravel()[dropped] = UNREACHABLE
+    next_hop.ravel()[dropped] = -1
+    return distance, next_hop
+
+def walk_distance_field(
+    distance: np.ndarray,
+    next_hop: np.ndarray,
+    start: Tuple[int, int],
+    grid: Any
+) -> tuple[float, list[Any]]:
+    """
+    Follow the next-hop field from start to the nearest source.
+
+    Like a_star_pathfinding, the start cell itself does not have to be traversable.
+
+    Args:
+        distance: Distance field from compute_distance_field.
+        next_hop: Next-hop field from compute_distance_field.
+        start: Starting coordinate (x, y).
+        grid: The grid the field was computed on, to tell sources on obstacles, which a start on an
+            obstacle cannot step onto, from traversable ones.
+
+    Returns:
+        Cost of the path and the list of coordinates from start to the nearest source, or (inf, []) if none is reachable.
+    """
+    rows, cols = distance.shape
+    r, c = int(start[0]), int(start[1])
+    if not (0 <= r < rows and 0 <= c < cols):
+        return float('inf'), []
+
+    path = [(r, c)]
+    if distance[r, c] == UNREACHABLE:
+        # Step onto the reachable neighbour closest to a source, if the start cell is an obstacle
+        occupancy = _as_occupancy(grid)
+        neighbors = [
+            (nr, nc) for nr, nc in ((r, c + 1), (r + 1, c), (r, c - 1), (r - 1, c))
+            if 0 <= nr < rows and 0 <= nc < cols and distance[nr, nc] != UNREACHABLE and occupancy[nr, nc]
+        ]
+        if not neighbors:
+            return float('inf'), []
+        r, c = min(neighbors, key=lambda cell: distance[cell])
+        path.append((r, c))
+
+    cost = len(path) - 1 + int(distance[r, c])
+    current = int(next_hop[r, c])
+    flat_next_hop = next_hop.ravel()
+    while current != -1:
+        path.append(divmod(current, cols))
+        current = int(flat_next_hop[current])
+    return float(cost), path
+
+def build_grid(img, grid_size=10):
+    """
+    Occupancy grid of a BGR floorplan, the same as convert_image_to_grid(filter_walls_as_image(img), grid_size).
+
+    A cell is traversable when its tile has no wall pixel. The wall mask is built and reduced
+    to cells one band of GRID_BAND_ROWS cell rows at a time, so no full resolution intermediate
+    of the whole image is ever allocated.
+    """
+    grid_rows, grid_cols = img.shape[0] // grid_size, img.shape[1] // grid_size
+    grid = np.empty((grid_rows, grid_cols), dtype=np.uint8)
+    # An image narrower or shorter than one cell has no whole tile, like in convert_image_to_grid
+    for top in range(0, grid_rows if grid_cols else 0, GRID_BAND_ROWS):
+        bottom = min(grid_rows, top + GRID_BAND_ROWS)
+        walls = wall_mask(img[top * grid_size:bottom * grid_size, :grid_cols * grid_size])
+        # Area resampling by a whole factor averages every tile; in float32 any wall pixel keeps the mean above 0
+        wall_share = cv2.resize(walls.astype(np.float32), (grid_cols, bottom - top), interpolation=cv2.INTER_AREA)
+        np.equal(wall_share, 0, out=grid[top:bottom], casting="unsafe")
+    # Shared by every request, so searches must overlay changes instead of writing into it
+    grid.setflags(write=False)
+    return grid
+
+def patch_grid(grid, img, patches, grid_size=10):
+    """
+    Apply rectangular edits to an occupancy grid from build_grid.
+
+    Args:
+        grid: Occupancy grid built from img.
+        img: The BGR floorplan image.
+        patches: (kind, (y1, x1, y2, x2)) pairs in pixels, applied in order, with y2 and x2 exclusive.
+            kind is "wall" to block every cell the box touches, "open" to clear them, or "image"
+            to rebuild them from img.
+        grid_size: Size of each grid cell in pixels.
+
+    Returns:
+        The new read-only grid, and the flat indices of the cells that were closed and opened.
+    """
+    before = _as_occupancy(grid)
+    patched = before.copy()
+    rows, cols = patched.shape
+    for kind, (y1, x1, y2, x2) in patches:
+        top, left = max(0, y1 // grid_size), max(0, x1 // grid_size)
+        bottom, right = min(rows, (y2 - 1) // grid_size + 1), min(cols, (x2 - 1) // grid_size + 1)
+        if top >= bottom or left >= right:
+            continue
+        if kind == "wall":
+            patched[top:bottom, left:right] = 0
+        elif kind == "open":
+            patched[top:bottom, left:right] = 1
+        elif kind == "image":
+            patched[top:bottom, left:right] = build_grid(img[top * grid_size:bottom * grid_size, left * grid_size:right * grid_size], grid_size)
+        else:
+            raise ValueError(f"Unknown patch kind '{kind}'")
+
+    closed = np.flatnonzero((before == 1) & (patched == 0))
+    opened = np.flatnonzero((before == 0) & (patched == 1))
+    patched.setflags(write=False)
+    return patched, closed, opened
+
+def get_path_to_exit(grid, exit_field, start, grid_size=10):
+    """
+    Same result as get_path(grid, start, exits, grid_size) but read from the compute_distance_field of the exits in O(path length).
+    """
+    distance, next_hop = exit_field
+    cost, path_grid = walk_distance_field(distance, next_hop, pixel_to_grid(start, grid_size), grid)
+    return cost, [grid_to_pixel(coord, grid_size) for coord in path_grid]
 
 # PLease let Vincent know and update /api/fire when grid_size changes
-def get_path(img, start, goals, grid_size=10, heuristic_func=heuristic_manhattan):
+def get_path(grid, start, goals, grid_size=10, heuristic_func=heuristic_manhattan, method="astar"):
     # Visualize the grid
     # plt.imshow(grid, cmap='gray')
     # plt.title("Converted Grid")
@@ -176,7 +605,7 @@ def get_path(img, start, goals, grid_size=10, heuristic_func=heuristic_manhattan
     # print("Start (grid):", start_grid)
     # print("Goals (grid):", goals_grid)
 
-    distance, optimal_path_grid = a_star_pathfinding(globals.grid, start_grid, goals_grid, heuristic_func)
+    distance, optimal_path_grid = a_star_pathfinding(grid, start_grid, goals_grid, heuristic_func, method=method)
 
     # Visualize the path on the grid
     optimal_path_pixels = [grid_to_pixel(coord, grid_size) for coord in optimal_path_grid]
@@ -189,37 +618,103 @@ def get_path(img, start, goals, grid_size=10, heuristic_func=heuristic_manhattan
     return distance, optimal_path_pixels
 
 #===============================================================================================
+@lru_cache(maxsize=None)
+def fire_disk(fire_size: str, fire_proximity_threshold: int = 150, grid_size: int = 10) -> np.ndarray:
+    """
+    Boolean disk mask of the cells around a fire, centred in a (2r + 1) x (2r + 1) array.
+
+    Masks are computed once per fire size and returned read-only, so they can be shared between requests.
+    """
+    fire_radius = fire_proximity_threshold // grid_size
+    if fire_size == "l":
+        fire_radius *= 2  # Increase radius for large fires
+
+    offsets = np.arange(-fire_radius, fire_radius + 1)
+    disk = offsets[:, None] ** 2 + offsets[None, :] ** 2 <= fire_radius ** 2
+    disk.setflags(write=False)
+    return disk
+
+def fire_zone_mask(
+    shape: Tuple[int, int],
+    fire_coords: List[Tuple[int, int]],
+    fire_proximity_threshold: int = 150,
+    fire_size: str = "s",
+    grid_size: int = 10
+) -> np.ndarray:
+    """
+    Overlay of all fire zones as a boolean grid (True = on fire), without touching any occupancy grid.
+
+    Args:
+        shape: (rows, cols) of the grid.
+        fire_coords: List of fire coordinates in pixels [(fy1, fx1), (fy2, fx2), ...].
+        fire_proximity_threshold: Distance from the fire center to mark as dangerous.
+        fire_size: Size of the fire ("s" for small, "l" for large).
+        grid_size: Size of each grid cell in pixels.
+
+    Returns:
+        Boolean array of the given shape.
+    """
+    rows, cols = shape
+    disk = fire_disk(fire_size, fire_proximity_threshold, grid_size)
+    fire_radius = disk.shape[0] // 2
+
+    mask = np.zeros(shape, dtype=bool)
+    for fy, fx in fire_coords:
+        row, col = int(fy) // grid_size, int(fx) // grid_size  # Map fire coords to grid
+        top, bottom = max(0, row - fire_radius), min(rows, row + fire_radius + 1)
+        left, right = max(0, col - fire_radius), min(cols, col + fire_radius + 1)
+        if top >= bottom or left >= right:
+            continue
+        mask[top:bottom, left:right] |= disk[
+            top - (row - fire_radius):bottom - (row - fire_radius),
+            left - (col - fire_radius):right - (col - fire_radius)
+        ]
+    return mask
+
 def mark_fire_zones(
     grid: List[List[int]],
     fire_coords: List[Tuple[int, int]],
     fire_proximity_threshold: int,
     fire_size: str,
     grid_size: int
-) -> List[List[int]]:
+) -> np.ndarray:
     """
     Mark fire-affected zones in the grid as non-traversable.
 
+    The input grid is left untouched; search code should prefer combining fire_zone_mask with the grid itself.
+
     Args:
         grid: 2D grid representation of the map.
-        fire_coords: List of fire coordinates [(fx1, fy1), (fx2, fy2), ...].
+        fire_coords: List of fire coordinates in pixels [(fy1, fx1), (fy2, fx2), ...].
         fire_proximity_threshold: Distance from the fire center to mark as dangerous.
         fire_size: Size of the fire ("s" for small, "l" for large).
         grid_size: Size of each grid cell in pixels.
 
     Returns:
-        Updated grid with fire zones marked as non-traversable (0).
+        New grid with fire zones marked as non-traversable (0).
     """
-    fire_radius = fire_proximity_threshold // grid_size
-    if fire_size == "l":
-        fire_radius *= 2  # Increase radius for large fires
+    occupancy = _as_occupancy(grid)
+    mask = fire_zone_mask(occupancy.shape, fire_coords, fire_proximity_threshold, fire_size, grid_size)
+    return np.where(mask, 0, occupancy).astype(np.uint8)
 
-    rows, cols = len(grid), len(grid[0])
-    for fy, fx in fire_coords:
-        fx_grid, fy_grid = fx // grid_size, fy // grid_size  # Map fire coords to grid
-        for i in range(max(0, fx_grid - fire_radius), min(rows, fx_grid + fire_radius + 1)):
-            for j in range(max(0, fy_grid - fire_radius), min(cols, fy_grid + fire_radius + 1)):
-                # Mark cells within the fire radius as non-traversable
-                if (i - fx_grid) ** 2 + (j - fy_grid) ** 2 <= fire_radius ** 2:
-                    grid[i][j] = 0
-
-    return grid
\ No newline at end of file
+def fire_cost_field(fire_zone: np.ndarray, weighted: bool = True) -> np.ndarray:
+    """
+    Per-cell traversal cost of the fire zones and the cells around them, used as edge weights by a_star_pathfinding.
+
+    Args:
+        fire_zone: Boolean grid of the fire zones, as returned by fire_zone_mask.
+        weighted: Whether the cells around the fire zones cost more too.
+
+    Returns:
+        int32 array of the cost of entering each cell: FIRE_ZONE_COST inside a fire zone, and 1
+        elsewhere, rising quadratically within FIRE_DANGER_RADIUS cells of a fire zone if weighted.
+    """
+    if weighted:
+        # Euclidean distance, in cells, from every cell to the nearest fire zone cell
+        fire_distance = cv2.distanceTransform((~fire_zone).astype(np.uint8), cv2.DIST_L2, cv2.DIST_MASK_PRECISE)
+        danger = np.maximum(0, FIRE_DANGER_RADIUS - fire_distance)
+        cost = (1 + np.rint(FIRE_DANGER_WEIGHT * danger ** 2)).astype(np.int32)
+    else:
+        cost = np.ones(fire_zone.shape, dtype=np.int32)
+    cost[fire_zone] = FIRE_ZONE_COST
+    return cost
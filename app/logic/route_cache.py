@@ -0,0 +1,146 @@
+# Cached routes between points of interest (icons and rooms) of one floorplan
+from typing import Tuple, List, Optional, Dict, Any, Callable
+
+import numpy as np
+
+from app.logic.pathfind import compute_distance_field, patch_distance_field, walk_distance_field, pixel_to_grid
+
+
+def label_cells(coordinates: Dict[str, Any], label: str, grid_size: int) -> List[Tuple[int, int]]:
+    """
+    Grid cells of the midpoints of every bounding box with this label, icons taking precedence over rooms.
+    """
+    boxes = coordinates["icons"].get(label) or coordinates["rooms"].get(label) or []
+    # bbox is in (y1, x1, y2, x2)
+    return [pixel_to_grid(((bbox[0] + bbox[2]) // 2, (bbox[1] + bbox[3]) // 2), grid_size) for bbox in boxes]
+
+
+def rooms_near(coordinates: Dict[str, Any], point: Tuple[int, int]) -> List[str]:
+    """
+    Names of the room labels by the distance of their nearest bounding box to the (y, x) pixel
+    point, rooms whose box contains the point first.
+    """
+    distances = {}
+    for name, boxes in coordinates["rooms"].items():
+        # bbox is in (y1, x1, y2, x2)
+        for y1, x1, y2, x2 in boxes:
+            distance = max(0, y1 - point[0], point[0] - y2) + max(0, x1 - point[1], point[1] - x2)
+            distances[name] = min(distance, distances.get(name, distance))
+    return sorted(distances, key=distances.__getitem__)
+
+
+def room_at(coordinates: Dict[str, Any], point: Tuple[int, int]) -> str:
+    """
+    Name of the room label whose bounding box contains the (y, x) pixel point, or else the
+    nearest one. Empty if the floorplan has no room labels.
+    """
+    rooms = rooms_near(coordinates, point)
+    return rooms[0] if rooms else ""
+
+
+class RouteCache:
+    """
+    Shortest distances and paths between the points of interest of one floorplan.
+
+    Every label gets one multi-source distance field from all of its instances, so the nearest
+    instance of a label is a lookup from any cell. Icon fields are built up front because most
+    instruction paths go through exits, extinguishers and hosereels; room fields are built on
+    first use. Fields restored from an earlier run can be passed in as fields.
+
+    on_grow, if set, is called after a field is added, e.g. by the registry to keep to its byte budget.
+    """
+
+    def __init__(
+        self,
+        grid: Any,
+        coordinates: Dict[str, Any],
+        grid_size: int = 10,
+        fields: Optional[Dict[str, Tuple[np.ndarray, np.ndarray]]] = None
+    ):
+        self.grid = grid
+        self.coordinates = coordinates
+        self.grid_size = grid_size
+        self.fields: Dict[str, Tuple[np.ndarray, np.ndarray]] = dict(fields or {})
+        self.on_grow: Optional[Callable[[], None]] = None
+        for label in coordinates["icons"]:
+            self.field(label)
+
+    def field(self, label: str) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Distance and next-hop fields towards the nearest instance of label.
+        """
+        if label not in self.fields:
+            self.fields[label] = compute_distance_field(self.grid, label_cells(self.coordinates, label, self.grid_size))
+            if self.on_grow is not None:
+                self.on_grow()
+        return self.fields[label]
+
+    def edited(
+        self,
+        grid: Any,
+        coordinates: Dict[str, Any],
+        closed: np.ndarray,
+        opened: np.ndarray,
+        changed_labels: Tuple[str, ...] = ()
+    ) -> "RouteCache":
+        """
+        Route cache of an edited floorplan, keeping every field the edit leaves valid.
+
+        Args:
+            grid: Edited grid.
+            coordinates: Edited coordinates.
+            closed: Flat indices of the cells that became obstacles, see pathfind.patch_grid.
+            opened: Flat indices of the cells that became traversable.
+            changed_labels: Labels whose instances were added or moved.
+        """
+        fields = {}
+        for label, field in self.fields.items():
+            if label in changed_labels:
+                continue
+            patched = patch_distance_field(field, closed, opened)
+            if patched is not None:
+                fields[label] = patched
+        return RouteCache(grid, coordinates, self.grid_size, fields)
+
+    def best_route(
+        self,
+        start_label: str,
+        end_label: str,
+        hazard: Optional[np.ndarray] = None
+    ) -> Optional[tuple[float, list[Any]]]:
+        """
+        Shortest route from any instance of start_label to any instance of end_label.
+
+        Args:
+            start_label: Icon or room name to start from.
+            end_label: Icon or room name to end at.
+            hazard: Optional boolean grid of the cells that cost more than 1 to enter during a fire.
+
+        Returns:
+            Cost and grid path of the best route, (inf, []) if there is none, or None if a hazard
+            makes the cached routes unreliable and the caller has to search the fire grid itself.
+        """
+        distance, next_hop = self.field(end_label)
+        routes = [walk_distance_field(distance, next_hop, start, self.grid) for start in label_cells(self.coordinates, start_label, self.grid_size)]
+        if not routes:
+            return float('inf'), []
+        if hazard is None:
+            return min(routes, key=lambda route: route[0])
+
+        # A hazard only ever makes routes longer, so a route that stays clear of it is still the
+        # shortest for its start. It is the overall best unless a route through the hazard was shorter.
+        clear = []
+        blocked_cost = float('inf')
+        for cost, path in routes:
+            if not path:
+                continue
+            cells = np.array(path[1:], dtype=np.intp).reshape(-1, 2)
+            if hazard[cells[:, 0], cells[:, 1]].any():
+                blocked_cost = min(blocked_cost, cost)
+            else:
+                clear.append((cost, path))
+
+        best = min(clear, key=lambda route: route[0], default=(float('inf'), []))
+        if blocked_cost < best[0]:
+            return None
+        return best
@@ -1,12 +1,26 @@
+from contextlib import asynccontextmanager
+
 import cv2
 from fastapi import FastAPI
 from dotenv import load_dotenv
+from app import executor
 from app.floorplan import floorplan_router
 from app.fire import fire_router
+from app.logic.icons import load_icon_templates
 from app.logic.llm.recommendation import recommend
 
 load_dotenv()
-app = FastAPI()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Read and preprocess the icon templates once, before the first floorplan arrives
+    load_icon_templates()
+    yield
+    # Stop the worker pools used by the endpoints for CPU-bound work
+    executor.shutdown()
+
+app = FastAPI(lifespan=lifespan)
 
 @app.get("/")
 async def root():
@@ -0,0 +1,184 @@
+# Loaded floorplans, keyed by floorplan ID, shared by every request of the server process
+import mmap
+import os
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Tuple, Dict, Any, List, Optional
+
+import cv2
+import numpy as np
+
+from app.artifacts import FloorplanArtifacts, artifact_store
+from app.executor import run_in_thread
+from app.logic.route_cache import RouteCache
+
+# Most floorplans kept in memory, and the most bytes of arrays they may hold together
+REGISTRY_MAX_ENTRIES = int(os.environ.get("PATH_HERO_REGISTRY_MAX_ENTRIES", 16))
+REGISTRY_MAX_BYTES = int(os.environ.get("PATH_HERO_REGISTRY_MAX_BYTES", 1 << 30))
+
+
+@dataclass
+class Floorplan:
+    """
+    Everything the endpoints need of one processed floorplan. Treat it as immutable: it is
+    shared by concurrent requests, and its arrays are read-only.
+
+    coordinates = {
+        "icons": {"exit": [[y1, x1, y2, x2], ...], "extinguisher_powder": [...], ...},
+        "rooms": {"Hospital Level 5": [[y1, x1, y2, x2], ...], "Bed Lift": [...], ...},
+        "grid_size": int,  # Grid size used for pathfinding (e.g., 10)
+        "height": int,     # Height of the processed floor image in pixels
+        "width": int       # Width of the processed floor image in pixels
+    }
+    """
+    floorplan_id: str
+    image: np.ndarray  # BGR
+    image_digest: str  # SHA-256 of the encoded image file, which stays in the artifact store
+    grid: np.ndarray
+    coordinates: Dict[str, Any]
+    route_cache: RouteCache
+
+    @property
+    def exit_field(self) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Distance and next-hop fields towards the nearest exit, for pathfind.get_path_to_exit.
+        """
+        return self.route_cache.field("exit")
+
+    def arrays(self) -> List[np.ndarray]:
+        """
+        The arrays held in memory. Memory-mapped ones, such as a large image or anything
+        restored from the artifact store, are paged in and out by the OS, so they are left out.
+        """
+        arrays = [self.image, self.grid]
+        arrays += [array for field in list(self.route_cache.fields.values()) for array in field]
+        return [array for array in arrays if not _is_memory_mapped(array)]
+
+
+def _is_memory_mapped(array: np.ndarray) -> bool:
+    # Views of a memory map, e.g. np.asarray of an np.load(mmap_mode="r"), reach it through .base
+    while array is not None:
+        if isinstance(array, (np.memmap, mmap.mmap)):
+            return True
+        array = getattr(array, "base", None)
+    return False
+
+
+def _owner(array: np.ndarray) -> np.ndarray:
+    # The array that owns the memory of a view
+    while isinstance(array.base, np.ndarray):
+        array = array.base
+    return array
+
+
+class FloorplanRegistry:
+    """
+    Least recently used cache of Floorplans.
+
+    Lookups and inserts take a lock, so any number of request threads can share it. Beyond
+    max_entries floorplans or max_bytes of arrays the least recently used ones are dropped;
+    they stay in the artifact store and are restored from there on their next use. The budget
+    is checked again whenever the route cache of an entry builds a field.
+    """
+
+    def __init__(self, max_entries: int = REGISTRY_MAX_ENTRIES, max_bytes: int = REGISTRY_MAX_BYTES):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries: OrderedDict[str, Floorplan] = OrderedDict()
+        self._lock = threading.RLock()
+        # The most recently added floorplan, used by requests that do not name one
+        self.latest_id: Optional[str] = None
+
+    def get(self, floorplan_id: Optional[str] = None) -> Optional[Floorplan]:
+        with self._lock:
+            floorplan_id = floorplan_id or self.latest_id
+            floorplan = self._entries.get(floorplan_id)
+            if floorplan is not None:
+                self._entries.move_to_end(floorplan_id)
+            return floorplan
+
+    def put(self, floorplan: Floorplan, latest: bool = True):
+        with self._lock:
+            self._entries[floorplan.floorplan_id] = floorplan
+            self._entries.move_to_end(floorplan.floorplan_id)
+            if latest:
+                self.latest_id = floorplan.floorplan_id
+            floorplan.route_cache.on_grow = self.trim
+            self.trim()
+
+    def nbytes(self) -> int:
+        """
+        Bytes of the arrays the entries hold in memory, counting the ones they share, such as
+        the image and carried over fields of edits, once.
+        """
+        with self._lock:
+            owners = {id(owner): owner for entry in self._entries.values() for owner in map(_owner, entry.arrays())}
+        return sum(owner.nbytes for owner in owners.values())
+
+    def trim(self):
+        """
+        Drop least recently used entries until the rest fit max_entries and max_bytes. The
+        newest entry always stays, however large it is.
+        """
+        with self._lock:
+            while len(self._entries) > 1 and (len(self._entries) > self.max_entries or self.nbytes() > self.max_bytes):
+                self._entries.popitem(last=False)
+
+    def __contains__(self, floorplan_id: str) -> bool:
+        with self._lock:
+            return floorplan_id in self._entries
+
+
+def restore_floorplan(floorplan_id: str, grid_size: int = 10) -> Optional[Floorplan]:
+    """
+    Rebuild a Floorplan from its artifact store entry, or None if there is none.
+    """
+    stored = artifact_store.load(floorplan_id)
+    if stored is None:
+        return None
+    # Large images were kept as a memory map of the decoded pixels; others are decoded from their file
+    image = artifact_store.load_image(stored.image_digest)
+    if image is None:
+        image_bytes = artifact_store.load_image_file(stored.image_digest)
+        image = cv2.imdecode(np.frombuffer(image_bytes, dtype=np.uint8), cv2.IMREAD_COLOR) if image_bytes else None
+    if image is None:
+        return None
+    return Floorplan(
+        floorplan_id=floorplan_id,
+        image=image,
+        image_digest=stored.image_digest,
+        grid=stored.grid,
+        coordinates=stored.coordinates,
+        route_cache=RouteCache(stored.grid, stored.coordinates, grid_size=grid_size, fields=stored.route_fields)
+    )
+
+
+def save_floorplan(floorplan: Floorplan):
+    """
+    Write a Floorplan to the artifact store, so restore_floorplan can rebuild it.
+    """
+    artifact_store.save(floorplan.floorplan_id, FloorplanArtifacts(
+        image_digest=floorplan.image_digest,
+        grid=floorplan.grid,
+        coordinates=floorplan.coordinates,
+        route_fields=dict(floorplan.route_cache.fields)
+    ))
+
+
+registry = FloorplanRegistry()
+
+
+async def get_floorplan(floorplan_id: Optional[str] = None) -> Optional[Floorplan]:
+    """
+    The floorplan with this ID, or the latest one if no ID is given, restoring it from the
+    artifact store if it is not in memory. None if it was never processed.
+    """
+    # The latest floorplan may have been evicted too, so resolve it before falling back to the store
+    floorplan_id = floorplan_id or registry.latest_id
+    floorplan = registry.get(floorplan_id)
+    if floorplan is None and floorplan_id:
+        floorplan = await run_in_thread(restore_floorplan, floorplan_id)
+        if floorplan is not None:
+            registry.put(floorplan, latest=False)
+    return floorplan
@@ -0,0 +1,49 @@
+# Randomized checks of the bucketed combine_bounding_boxes in app/logic/ocr.py against the original pairwise one
+import random
+
+import pytest
+
+from app.logic.ocr import calculate_distance, combine_bounding_boxes
+
+
+def baseline_combine_bounding_boxes(bounding_boxes, distance_threshold=50):
+    """The original version, which checks every pair of boxes."""
+    combined_boxes = []
+    used = set()
+
+    for i, box1 in enumerate(bounding_boxes):
+        if i in used:
+            continue
+        combined_text = box1['text']
+        combined_coords = list(box1['coordinates'])
+        used.add(i)
+
+        for j, box2 in enumerate(bounding_boxes):
+            if j in used or i == j:
+                continue
+            if calculate_distance(combined_coords, box2['coordinates']) < distance_threshold:
+                combined_text += f" {box2['text']}"
+                x1, y1, x2, y2 = combined_coords
+                x3, y3, x4, y4 = box2['coordinates']
+                combined_coords = [min(x1, x3), min(y1, y3), max(x2, x4), max(y2, y4)]
+                used.add(j)
+
+        combined_boxes.append({'text': combined_text, 'coordinates': tuple(int(v) for v in combined_coords)})
+
+    return combined_boxes
+
+
+def random_words(rng, count, extent):
+    words = []
+    for index in range(count):
+        x, y = rng.randrange(extent), rng.randrange(extent)
+        words.append({'text': f"w{index}", 'coordinates': (x, y, x + rng.randint(5, 80), y + rng.randint(5, 30))})
+    return words
+
+
+@pytest.mark.parametrize("seed", range(100))
+def test_combine_matches_baseline(seed):
+    rng = random.Random(seed)
+    words = random_words(rng, rng.randint(0, 60), rng.choice([200, 600, 2000]))
+    threshold = rng.choice([0, 1, 10, 50, 120])
+    assert combine_bounding_boxes(words, threshold) == baseline_combine_bounding_boxes(words, threshold)
@@ -0,0 +1,192 @@
+# Randomized checks of the pathfinding in app/logic/pathfind.py against simple reference searches
+import heapq
+import random
+
+import numpy as np
+import pytest
+
+from app.logic.pathfind import (
+    FIRE_ZONE_COST,
+    UNREACHABLE,
+    a_star_pathfinding,
+    compute_distance_field,
+    fire_cost_field,
+    multi_target_pathfinding,
+    patch_distance_field,
+    patch_grid,
+    walk_distance_field,
+)
+
+DIRECTIONS = [(0, 1), (1, 0), (0, -1), (-1, 0)]
+
+
+def baseline_a_star(grid, start, goals):
+    """
+    The original dict-and-tuple A*, path only: its returned cost was always 0, and it never
+    steps onto obstacles, goals included.
+    """
+    rows, cols = len(grid), len(grid[0])
+    open_set = [(0, start)]
+    came_from = {}
+    g_score = {start: 0}
+    while open_set:
+        _, current = heapq.heappop(open_set)
+        if current in goals:
+            path = []
+            while current in came_from:
+                path.append(current)
+                current = came_from[current]
+            path.append(start)
+            return path[::-1]
+        for dx, dy in DIRECTIONS:
+            neighbor = (current[0] + dx, current[1] + dy)
+            if not (0 <= neighbor[0] < rows and 0 <= neighbor[1] < cols) or grid[neighbor[0]][neighbor[1]] != 1:
+                continue
+            tentative_g_score = g_score[current] + 1
+            if tentative_g_score < g_score.get(neighbor, float('inf')):
+                came_from[neighbor] = current
+                g_score[neighbor] = tentative_g_score
+                estimate = min(abs(neighbor[0] - g[0]) + abs(neighbor[1] - g[1]) for g in goals)
+                heapq.heappush(open_set, (tentative_g_score + estimate, neighbor))
+    return []
+
+
+def dijkstra(grid, starts, goals, step_costs):
+    """
+    Cheapest cost from any start to any goal, paying step_costs of every cell entered.
+    """
+    rows, cols = len(grid), len(grid[0])
+    best = {start: 0 for start in starts}
+    queue = [(0, start) for start in starts]
+    heapq.heapify(queue)
+    while queue:
+        cost, current = heapq.heappop(queue)
+        if cost > best[current]:
+            continue
+        if current in goals:
+            return cost
+        for dy, dx in DIRECTIONS:
+            r, c = current[0] + dy, current[1] + dx
+            if 0 <= r < rows and 0 <= c < cols and grid[r][c] == 1:
+                if cost + int(step_costs[r, c]) < best.get((r, c), float('inf')):
+                    best[(r, c)] = cost + int(step_costs[r, c])
+                    heapq.heappush(queue, (best[(r, c)], (r, c)))
+    return float('inf')
+
+
+def random_grid(rng, rows, cols, density):
+    return (rng.random((rows, cols)) > density).astype(np.uint8)
+
+
+def open_cells(rng, grid, count):
+    cells = np.argwhere(grid == 1)
+    picks = rng.choice(len(cells), size=min(count, len(cells)), replace=False)
+    return [(int(r), int(c)) for r, c in cells[picks]]
+
+
+def assert_valid_path(grid, path, starts, goals):
+    assert path[0] in starts and path[-1] in goals
+    for (r1, c1), (r2, c2) in zip(path, path[1:]):
+        assert abs(r1 - r2) + abs(c1 - c2) == 1
+        assert grid[r2][c2] == 1
+
+
+@pytest.mark.parametrize("seed", range(40))
+@pytest.mark.parametrize("method", ["astar", "jps"])
+def test_a_star_matches_baseline(seed, method):
+    rng = np.random.default_rng(seed)
+    grid = random_grid(rng, int(rng.integers(5, 30)), int(rng.integers(5, 30)), rng.uniform(0.1, 0.4))
+    start, *goals = open_cells(rng, grid, int(rng.integers(2, 5)))
+    if not goals:
+        pytest.skip("grid too full")
+
+    expected = baseline_a_star(grid.tolist(), start, goals)
+    cost, path = a_star_pathfinding(grid.tolist(), start, goals, heuristic=False, method=method)
+    assert len(path) == len(expected)
+    if expected:
+        assert cost == len(path) - 1
+        assert_valid_path(grid, path, [start], goals)
+    else:
+        assert cost == float('inf')
+
+
+@pytest.mark.parametrize("seed", range(20))
+@pytest.mark.parametrize("method", ["astar", "jps"])
+def test_multi_target_matches_every_pair(seed, method):
+    rng = np.random.default_rng(seed)
+    grid = random_grid(rng, 20, 20, 0.3)
+    cells = open_cells(rng, grid, 6)
+    starts, goals = cells[:3], cells[3:]
+
+    expected = min(a_star_pathfinding(grid, start, goals, heuristic=False)[0] for start in starts)
+    cost, start_index, goal_index, path = multi_target_pathfinding(grid, starts, goals, heuristic=False, method=method)
+    assert cost == expected
+    if path:
+        assert path[0] == starts[start_index] and path[-1] == goals[goal_index]
+        assert_valid_path(grid, path, starts, goals)
+
+
+@pytest.mark.parametrize("seed", range(20))
+@pytest.mark.parametrize("weighted", [False, True])
+def test_fire_costs_match_dijkstra(seed, weighted):
+    rng = np.random.default_rng(seed)
+    grid = random_grid(rng, 30, 30, 0.2)
+    fire_zone = np.zeros(grid.shape, dtype=bool)
+    y, x = rng.integers(0, 30, size=2)
+    fire_zone[max(0, y - 4):y + 5, max(0, x - 4):x + 5] = True
+    fire_costs = fire_cost_field(fire_zone, weighted=weighted)
+    start, goal = open_cells(rng, grid, 2)
+
+    cost, path = a_star_pathfinding(grid, start, [goal], heuristic=weighted, fire_costs=fire_costs)
+    assert cost == dijkstra(grid, [start], [goal], fire_costs)
+    if path:
+        assert cost == sum(int(fire_costs[cell]) for cell in path[1:])
+
+
+def test_fire_zone_is_left_and_entered():
+    grid = np.ones((9, 9), dtype=np.uint8)
+    fire_zone = np.zeros(grid.shape, dtype=bool)
+    fire_zone[3:6, :5] = True
+    fire_costs = fire_cost_field(fire_zone, weighted=False)
+
+    # A route around the zone beats one through it, and a start inside it still gets out
+    cost, path = a_star_pathfinding(grid, (0, 0), [(8, 0)], heuristic=False, fire_costs=fire_costs)
+    assert cost < FIRE_ZONE_COST and len(path) > 9
+    cost, path = a_star_pathfinding(grid, (4, 0), [(0, 0)], heuristic=False, fire_costs=fire_costs)
+    assert path and cost == 3 + FIRE_ZONE_COST
+
+
+@pytest.mark.parametrize("seed", range(30))
+def test_distance_field_matches_a_star(seed):
+    rng = np.random.default_rng(seed)
+    grid = random_grid(rng, 25, 25, 0.3)
+    sources = open_cells(rng, grid, 3)
+    distance, next_hop = compute_distance_field(grid, sources)
+
+    for start in open_cells(rng, grid, 10):
+        expected, _ = a_star_pathfinding(grid, start, sources, heuristic=False)
+        cost, path = walk_distance_field(distance, next_hop, start, grid)
+        assert cost == expected
+        if path:
+            assert_valid_path(grid, path, [start], sources)
+        else:
+            assert distance[start] == UNREACHABLE
+
+
+@pytest.mark.parametrize("seed", range(60))
+def test_patched_distance_field_matches_recomputation(seed):
+    rng = np.random.default_rng(seed)
+    edits = random.Random(seed)
+    grid = random_grid(rng, 20, 20, rng.uniform(0.2, 0.5))
+    sources = open_cells(rng, grid, 2)
+    field = compute_distance_field(grid, sources)
+
+    for _ in range(5):
+        y, x = edits.randrange(20), edits.randrange(20)
+        box = (y, x, y + edits.randint(1, 3), x + edits.randint(1, 3))
+        grid, closed, opened = patch_grid(grid, None, [(edits.choice(["wall", "open"]), box)], grid_size=1)
+        patched = patch_distance_field(field, closed, opened)
+        field = compute_distance_field(grid, sources)
+        if patched is not None:
+            np.testing.assert_array_equal(patched[0], field[0])
+            np.testing.assert_array_equal(patched[1], field[1])